@@ -0,0 +1,136 @@
+import hmac
+import os
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_restx import Namespace, Resource, fields
+from ..utils.cache import cache
+from ..utils.metrics import metrics
+from ..utils import db
+from ..models.job import Job
+from ..decorators.decorator import teacher_required
+from http import HTTPStatus
+
+
+admin_namespace = Namespace('admin', description='Namespace for monitoring and operations')
+
+cache_stats_model = admin_namespace.model(
+    'CacheStats', {
+        'backend': fields.String(description="Cache backend in use"),
+        'hits': fields.Integer(description="Lookups answered from the cache"),
+        'misses': fields.Integer(description="Lookups that went to the database"),
+        'hit_ratio': fields.Float(description="hits / (hits + misses)"),
+    }
+)
+
+pool_stats_model = admin_namespace.model(
+    'PoolStats', {
+        'pid': fields.Integer(description="Worker process ID"),
+        'pool': fields.String(description="Connection pool class"),
+        'size': fields.Integer(description="Connections kept open (pool_size)"),
+        'checked_in': fields.Integer(description="Idle connections in the pool"),
+        'checked_out': fields.Integer(description="Connections in use"),
+        'overflow': fields.Integer(description="Connections opened beyond pool_size"),
+        'status': fields.String(description="SQLAlchemy's pool status line"),
+    }
+)
+
+
+def get_pool_stats():
+    """ Connection pool usage of this worker; counters are None for pools without them (e.g. SQLite) """
+    pool = db.engine.pool
+
+    def counter(name):
+        method = getattr(pool, name, None)
+        return method() if callable(method) else None
+
+    return {
+        'pid': os.getpid(),
+        'pool': type(pool).__name__,
+        'size': counter('size'),
+        'checked_in': counter('checkedin'),
+        'checked_out': counter('checkedout'),
+        'overflow': counter('overflow'),
+        'status': pool.status(),
+    }
+
+
+def scraper_or_teacher_required(function):
+    """ Let in the bearer of METRICS_TOKEN (a Prometheus scraper), when one is configured, or a teacher """
+    protected = teacher_required()(function)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN')
+        authorization = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            return function(*args, **kwargs)
+        return protected(*args, **kwargs)
+    return wrapper
+
+
+@admin_namespace.route('/cache')
+class CacheStatsView(Resource):
+
+    @admin_namespace.marshal_with(cache_stats_model)
+    @admin_namespace.doc(
+        description="Hit and miss counters of this worker's cache"
+    )
+    @teacher_required()
+    def get(self):
+        """
+            Get cache statistics
+        """
+        return cache.stats(), HTTPStatus.OK
+
+
+@admin_namespace.route('/metrics')
+class MetricsView(Resource):
+
+    @admin_namespace.doc(
+        description="Per endpoint request latency, SQL statement count and database time "
+                    "of this worker, in the Prometheus text format. Requires a teacher, "
+                    "or the METRICS_TOKEN as a bearer token"
+    )
+    @scraper_or_teacher_required
+    def get(self):
+        """
+            Get Prometheus metrics
+        """
+        stats = cache.stats()
+        pool = get_pool_stats()
+        extra = [
+            ('cache_hits_total', 'counter', 'Cache lookups answered from the cache.', [({}, stats['hits'])]),
+            ('cache_misses_total', 'counter', 'Cache lookups that went to the database.', [({}, stats['misses'])]),
+        ]
+        pool_gauges = {
+            'size': 'Connections kept open by the pool.',
+            'checked_in': 'Idle connections in the pool.',
+            'checked_out': 'Connections in use.',
+            'overflow': 'Connections opened beyond the pool size.',
+        }
+        extra += [
+            (f'db_pool_{name}', 'gauge', help_text, [({}, pool[name])])
+            for name, help_text in pool_gauges.items() if pool[name] is not None
+        ]
+        extra.append(('jobs', 'gauge', 'Background jobs, by status.', [
+            ({'status': status}, count) for status, count in
+            db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status)
+        ]))
+        return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+
+@admin_namespace.route('/pool')
+class PoolStatsView(Resource):
+
+    @admin_namespace.marshal_with(pool_stats_model)
+    @admin_namespace.doc(
+        description="Database connection pool usage of the worker answering the request"
+    )
+    @teacher_required()
+    def get(self):
+        """
+            Get connection pool statistics
+        """
+        return get_pool_stats(), HTTPStatus.OK
+
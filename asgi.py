@@ -0,0 +1,49 @@
+import multiprocessing
+
+from api import create_app
+from api.config.config import (
+    config_dict, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_MAX_CONNECTIONS, ASYNC_DB_POOL_SIZE, ASYNC_DB_MAX_OVERFLOW
+)
+from api.utils import db
+from api.utils.asgi import ASGIApp
+import decouple
+
+app = ASGIApp(create_app(config=config_dict['prod']))
+
+# ASGI mode, with uvicorn workers under gunicorn:
+#
+#     gunicorn -c python:api.asgi api.asgi:app
+#
+# or with uvicorn alone: uvicorn api.asgi:app --workers 4
+#
+# Requires uvicorn, and asyncpg for Postgres (aiosqlite for SQLite). The read
+# endpoints with async handlers (the student and course lists, searches and
+# student details) run on each worker's event loop, sharing an async pool of
+# ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW connections; the others run in
+# ASGI_THREADS threads with the usual pool. The number of workers is capped
+# so that all the pools together stay within DB_MAX_CONNECTIONS:
+#
+#     workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW + ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW) <= DB_MAX_CONNECTIONS
+#
+# With the defaults (5 + 5 + 10 + 10 connections, 90 available) that is at most 3 workers.
+bind = decouple.config('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = decouple.config(
+    'GUNICORN_WORKERS',
+    max(1, min(
+        multiprocessing.cpu_count() * 2 + 1,
+        DB_MAX_CONNECTIONS // (DB_POOL_SIZE + DB_MAX_OVERFLOW + ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW)
+    )),
+    cast=int
+)
+timeout = decouple.config('GUNICORN_TIMEOUT', 30, cast=int)
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', 1000, cast=int)
+max_requests_jitter = decouple.config('GUNICORN_MAX_REQUESTS_JITTER', 100, cast=int)
+# As in runserver.py, workers fork from a master that already created the app
+preload_app = decouple.config('GUNICORN_PRELOAD_APP', True, cast=bool)
+
+
+def post_fork(server, worker):
+    with app.app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
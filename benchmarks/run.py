@@ -0,0 +1,362 @@
+"""
+Load test every REST endpoint of the students and courses namespaces.
+
+Each scenario is run at every concurrency level and reported with its
+throughput, p50/p95/p99 latency and SQL statements per request. Seed a
+database once, then run against it in process:
+
+    python -m api.benchmarks.run --database-url sqlite:///bench.sqlite3 --seed \\
+        --students 100000 --courses 2000 --enrollments 1000000
+    python -m api.benchmarks.run --database-url sqlite:///bench.sqlite3 --concurrency 1,4,16
+
+or against a running server (SQL counts need METRICS_SERVER_TIMING there):
+
+    python -m api.benchmarks.run --base-url http://localhost:8000 --concurrency 1,8,32
+
+All requests come from one address, so start that server with
+RATELIMIT_ENABLED=False (or limits well above the load) or the write
+scenarios measure 429 responses. In process the limiter is always off.
+
+Save a run with --output and pass it back with --baseline to fail (exit 1)
+when p95 latency or SQL statements per request regress beyond --tolerance.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from json import dumps, loads
+
+from ..utils.pagination import encode_cursor
+
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenario:
+
+    def __init__(self, name, method, build, write=False, destructive=False):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.write = write
+        self.destructive = destructive
+
+
+def base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+
+class Dataset:
+    """ What the scenarios know about the data under test """
+
+    def __init__(self, students, courses, enrollments, rng):
+        self.students = students
+        self.courses = courses
+        self.enrollments = enrollments
+        self.rng = rng
+        self.sequence = count(1)
+        # Tells apart the rows created by different runs against the same database
+        self.run = base36(int(time.time()))
+        self.lock = threading.RLock()
+
+    def student(self):
+        return self.rng.randint(1, self.students)
+
+    def course(self):
+        return self.rng.randint(1, self.courses)
+
+    def enrollment(self):
+        return self.rng.choice(self.enrollments)
+
+    def pop_enrollment(self):
+        with self.lock:
+            return self.enrollments.pop() if len(self.enrollments) > 1 else self.enrollments[0]
+
+    def unique(self):
+        """ A short token never returned before, e.g. for emails that must fit String(20) """
+        return f'{self.run}.{base36(next(self.sequence))}'
+
+
+def bulk_scores_csv(data):
+    lines = ['student_id,course_id,grade']
+    for _ in range(100):
+        student_id, course_id = data.enrollment()
+        lines.append(f'{student_id},{course_id},{data.rng.choice("ABCDEF")}')
+    return '\n'.join(lines) + '\n'
+
+
+SCENARIOS = [
+    Scenario('students.list', 'GET', lambda d: ('/students?limit=50', {})),
+    Scenario('students.list.after', 'GET', lambda d: (f'/students?limit=50&after={encode_cursor(d.student())}', {})),
+    Scenario('students.get', 'GET', lambda d: (f'/students/{d.student()}', {})),
+    Scenario('students.courses', 'GET', lambda d: (f'/students/{d.student()}/courses', {})),
+    Scenario('students.grades', 'GET', lambda d: (f'/students/{d.student()}/courses/grade', {})),
+    Scenario('students.register', 'POST', lambda d: ('/students/register/student', {'json': {
+        'email': f'b{d.unique()}@s.io', 'full_name': 'Bench', 'date_of_birth': '20000101'
+    }}), write=True),
+    Scenario('students.update', 'PUT', lambda d: (lambda id: (f'/students/{id}', {'json': {
+        'email': f's{id}@school.io', 'full_name': f'Student {id}'[:10], 'date_of_birth': '20000101'
+    }}))(d.student()), write=True),
+    Scenario('students.add_score', 'PUT', lambda d: (lambda pair: ('/students/course/add_score', {'json': {
+        'student_id': pair[0], 'course_id': pair[1], 'grade': d.rng.choice('ABCDEF')
+    }}))(d.enrollment()), write=True),
+    Scenario('students.bulk_scores', 'POST', lambda d: ('/students/course/scores/bulk', {
+        'data': bulk_scores_csv(d), 'content_type': 'text/csv'
+    }), write=True),
+    Scenario('students.delete', 'DELETE', lambda d: (f'/students/{d.student()}', {}), write=True, destructive=True),
+    Scenario('courses.list', 'GET', lambda d: ('/courses?limit=50', {})),
+    Scenario('courses.get', 'GET', lambda d: (f'/courses/{d.course()}', {})),
+    Scenario('courses.students', 'GET', lambda d: (f'/courses/{d.course()}/students', {})),
+    Scenario('courses.create', 'POST', lambda d: ('/courses', {'json': {'name': f'B{d.unique()}'[:20]}}), write=True),
+    Scenario('courses.update', 'PUT', lambda d: (lambda id: (f'/courses/{id}', {'json': {'name': f'CRS{id}'}}))(d.course()),
+             write=True),
+    Scenario('courses.enroll', 'POST', lambda d: ('/courses/students/', {'json': {
+        'student_id': d.student(), 'course_id': d.course()
+    }}), write=True),
+    Scenario('courses.bulk_enroll', 'POST', lambda d: ('/courses/students/batch', {'json': {'enrollments': [
+        {'student_id': d.student(), 'course_id': d.course()} for _ in range(100)
+    ]}}), write=True),
+    Scenario('courses.unenroll', 'DELETE', lambda d: (lambda pair: (f'/courses/{pair[1]}/students/{pair[0]}', {}))(
+        d.pop_enrollment()), write=True, destructive=True),
+    Scenario('courses.delete', 'DELETE', lambda d: (f'/courses/{d.course()}', {}), write=True, destructive=True),
+]
+
+
+class InProcessClient:
+
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = headers
+
+    def request(self, method, path, json=None, data=None, content_type=None):
+        client = self.app.test_client()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=json, data=data,
+                               content_type=content_type, headers=self.headers)
+        body = response.get_data()
+        return response.status_code, response.headers.get('Server-Timing'), time.perf_counter() - start, body
+
+
+class RemoteClient:
+
+    def __init__(self, base_url, headers):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+
+    def request(self, method, path, json=None, data=None, content_type=None):
+        headers = dict(self.headers)
+        body = None
+        if json is not None:
+            body = dumps(json).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = data.encode()
+            headers['Content-Type'] = content_type
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                body = response.read()
+                status, server_timing = response.status, response.headers.get('Server-Timing')
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status, server_timing = e.code, e.headers.get('Server-Timing')
+        return status, server_timing, time.perf_counter() - start, body
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted list """
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(client, scenario, data, concurrency, requests):
+    latencies = []
+    statements = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = count(requests, -1)
+
+    def worker():
+        while next(remaining) > 0:
+            with data.lock:
+                path, kwargs = scenario.build(data)
+            status, server_timing, elapsed, _ = client.request(scenario.method, path, **kwargs)
+            match = SERVER_TIMING_QUERIES.search(server_timing or '')
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if match:
+                    statements.append(int(match.group(1)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        workers = [executor.submit(worker) for _ in range(concurrency)]
+        for future in workers:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'scenario': scenario.name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'server_errors': sum(n for status, n in statuses.items() if status >= 500),
+        'client_errors': sum(n for status, n in statuses.items() if 400 <= status < 500),
+        'throughput': len(latencies) / wall_time if wall_time else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'sql_per_request': sum(statements) / len(statements) if statements else None,
+    }
+
+
+def discover_enrollments(client, data, samples=50):
+    """ Find enrolled (student_id, course_id) pairs through the API itself """
+    pairs = []
+    for _ in range(samples):
+        student_id = data.student()
+        status, _, _, body = client.request('GET', f'/students/{student_id}/courses')
+        if status == 200:
+            pairs.extend((student_id, course['id']) for course in loads(body))
+    return pairs
+
+
+def format_report(results):
+    header = f"{'scenario':<22}{'conc':>5}{'reqs':>7}{'5xx':>6}{'4xx':>6}{'req/s':>10}" \
+             f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'sql/req':>9}"
+    lines = [header, '-' * len(header)]
+    for r in results:
+        sql = '-' if r['sql_per_request'] is None else f"{r['sql_per_request']:.1f}"
+        lines.append(
+            f"{r['scenario']:<22}{r['concurrency']:>5}{r['requests']:>7}{r['server_errors']:>6}"
+            f"{r['client_errors']:>6}{r['throughput']:>10.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+            f"{r['p99_ms']:>9.1f}{sql:>9}"
+        )
+    return '\n'.join(lines)
+
+
+def find_regressions(results, baseline, tolerance):
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get((r['scenario'], r['concurrency']))
+        if before is None:
+            continue
+        if r['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']} x{r['concurrency']}: p95 {before['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if r['sql_per_request'] is not None and before['sql_per_request'] is not None \
+                and r['sql_per_request'] > before['sql_per_request']:
+            regressions.append(f"{r['scenario']} x{r['concurrency']}: SQL per request "
+                               f"{before['sql_per_request']:.1f} -> {r['sql_per_request']:.1f}")
+    return regressions
+
+
+def make_app(database_url):
+    from .. import create_app
+    from ..config.config import config_dict
+    from ..utils.metrics import metrics
+
+    class BenchmarkConfig(config_dict['prod']):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ECHO = False
+        METRICS_SERVER_TIMING = True
+        # Every request comes from one client: measure the endpoints, not 429s
+        RATELIMIT_ENABLED = False
+        if database_url.startswith('sqlite'):
+            SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    app = create_app(config=BenchmarkConfig)
+    if 'metrics' not in app.extensions:
+        metrics.init_app(app)
+    return app
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the REST endpoints')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--database-url', help='Run the app in process against this database')
+    target.add_argument('--base-url', help='Benchmark a running server')
+    parser.add_argument('--seed', action='store_true', help='Create the schema and seed it first (in process only)')
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--enrollments', type=int, default=1000000)
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', help='Comma separated scenario name prefixes to run')
+    parser.add_argument('--reads-only', action='store_true', help='Skip scenarios that write')
+    parser.add_argument('--destructive', action='store_true', help='Also run scenarios that delete data')
+    parser.add_argument('--token', help='JWT sent as a Bearer token for protected endpoints')
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown against the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+
+    app_context = None
+    if args.database_url:
+        app = make_app(args.database_url)
+        app_context = app.app_context()
+        app_context.push()
+        if args.seed:
+            from ..utils import db
+            from .seed import seed
+            db.create_all()
+            seed(args.students, args.courses, args.enrollments, random_seed=args.random_seed)
+        client = InProcessClient(app, headers)
+    else:
+        client = RemoteClient(args.base_url, headers)
+
+    data = Dataset(args.students, args.courses, [], random.Random(args.random_seed))
+    data.enrollments = discover_enrollments(client, data) or [(1, 1)]
+
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if (not args.reads_only or not scenario.write) and (args.destructive or not scenario.destructive)
+        and (not args.scenarios or scenario.name.startswith(tuple(args.scenarios.split(','))))
+    ]
+    results = []
+    for scenario in scenarios:
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            results.append(run_scenario(client, scenario, data, concurrency, args.requests))
+            print(format_report(results[-1:]).splitlines()[-1], file=sys.stderr)
+
+    print(format_report(results))
+    if app_context is not None:
+        app_context.pop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
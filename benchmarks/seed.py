@@ -0,0 +1,86 @@
+import random
+from datetime import datetime
+
+from ..utils import db
+from ..models.students import Student
+from ..models.courses import Course
+from ..models.studentcourse import StudentCourse
+from ..models.grade import Score
+
+
+GRADES = ['A', 'B', 'C', 'D', 'E', 'F']
+
+
+def insert_in_batches(table, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def seed(students=100000, courses=2000, enrollments=1000000, graded=1.0, random_seed=0, batch_size=10000, log=print):
+    """
+    Fill an empty database with a synthetic, reproducible dataset: `students`
+    students, `courses` courses, `enrollments` distinct enrollments spread
+    evenly over the students and at random over the courses, and a score for
+    the `graded` fraction of enrollments.
+
+    Students reference users.id, so when a users table is mapped a row built
+    by Student.user_rows is inserted for every student first.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    enrollments = min(enrollments, students * courses)
+
+    users = db.metadata.tables.get('users')
+    if users is not None:
+        log(f'Seeding {students} users')
+        insert_in_batches(users, Student.user_rows(
+            {'id': id, 'email': f's{id}@school.io', 'full_name': f'Student {id}'[:10], 'created_at': now}
+            for id in range(1, students + 1)
+        ), batch_size)
+
+    log(f'Seeding {students} students')
+    insert_in_batches(Student.__table__, (
+        {
+            'id': id,
+            'email': f's{id}@school.io',
+            'full_name': f'Student {id}'[:10],
+            'date_of_birth': f'{rng.randint(1990, 2010)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}',
+            'created_at': now,
+        }
+        for id in range(1, students + 1)
+    ), batch_size)
+
+    log(f'Seeding {courses} courses')
+    insert_in_batches(Course.__table__, (
+        {'id': id, 'name': f'CRS{id}', 'created_at': now} for id in range(1, courses + 1)
+    ), batch_size)
+
+    def pairs():
+        # Every student takes enrollments // students courses, a few take one more
+        per_student, extra = divmod(enrollments, students)
+        for student_id in range(1, students + 1):
+            taken = per_student + (1 if student_id <= extra else 0)
+            for course_id in rng.sample(range(1, courses + 1), taken):
+                yield student_id, course_id
+
+    log(f'Seeding {enrollments} enrollments and their scores')
+    enrollment_rows = []
+    score_rows = []
+    for student_id, course_id in pairs():
+        enrollment_rows.append({'student_id': student_id, 'course_id': course_id, 'created_at': now})
+        if rng.random() < graded:
+            score_rows.append({'student_id': student_id, 'course_id': course_id,
+                               'grade': rng.choice(GRADES), 'created_at': now})
+        if len(enrollment_rows) == batch_size:
+            insert_in_batches(StudentCourse.__table__, enrollment_rows, batch_size)
+            insert_in_batches(Score.__table__, score_rows, batch_size)
+            enrollment_rows, score_rows = [], []
+    insert_in_batches(StudentCourse.__table__, enrollment_rows, batch_size)
+    insert_in_batches(Score.__table__, score_rows, batch_size)
@@ -0,0 +1,112 @@
+"""
+Compare the compiled serializer (utils/serializer.py) against flask-restx's
+marshal on large lists, for dict rows, SQL row tuples and ORM entities:
+
+    python -m api.benchmarks.serialize --rows 10000 --repeat 5
+
+Each case reports the best time of --repeat runs for building the output
+(marshal vs compiled) and for the whole body (marshal + json vs compiled +
+orjson, when orjson is installed).
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from flask_restx import marshal
+
+from ..utils.serializer import compile_model, orjson
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def make_cases(rows):
+    from ..courses.views import list_student_course_model, course_model
+    from ..students.views import students_model
+    from ..models.courses import Course
+    from ..utils import db
+
+    students = [
+        {'id': n, 'email': f's{n}@school.io', 'full_name': f'Student {n}', 'date_of_birth': '20000101'}
+        for n in range(rows)
+    ]
+    enrolled = [{'id': n, 'full_name': f'Student {n}', 'course_name': 'BCH101'} for n in range(rows)]
+    courses = [Course(id=n, name=f'C{n}', created_at=datetime.utcnow()) for n in range(rows)]
+
+    # Row tuples as returned by the projection queries
+    row_query = db.select(
+        db.literal_column('1').label('id'),
+        db.literal_column("'Student'").label('full_name'),
+        db.literal_column("'BCH101'").label('course_name'),
+    )
+    return [
+        ('students (dicts)', students_model, students),
+        ('course students (dicts)', list_student_course_model, enrolled),
+        ('course students (rows)', list_student_course_model, db.session.execute(row_query).all() * rows),
+        ('courses (entities)', course_model, courses),
+    ]
+
+
+def run(rows, repeat):
+    results = []
+    for name, model, data in make_cases(rows):
+        serialize = compile_model(model)
+        assert serialize(data) == marshal(data, model)
+
+        marshal_time = best_of(repeat, lambda: marshal(data, model))
+        compiled_time = best_of(repeat, lambda: serialize(data))
+        result = {
+            'case': name,
+            'rows': len(data),
+            'marshal_ms': marshal_time * 1000,
+            'compiled_ms': compiled_time * 1000,
+            'speedup': marshal_time / compiled_time,
+        }
+        if orjson is not None:
+            body_marshal = best_of(repeat, lambda: json.dumps(marshal(data, model)))
+            body_compiled = best_of(repeat, lambda: orjson.dumps(serialize(data)))
+            result['body_speedup'] = body_marshal / body_compiled
+        results.append(result)
+    return results
+
+
+def format_report(results):
+    lines = [f'{"case":<26}{"rows":>8}{"marshal ms":>12}{"compiled ms":>13}{"speedup":>9}{"with json":>11}']
+    for result in results:
+        body = f'{result["body_speedup"]:>10.1f}x' if 'body_speedup' in result else f'{"-":>11}'
+        lines.append(
+            f'{result["case"]:<26}{result["rows"]:>8}{result["marshal_ms"]:>12.1f}'
+            f'{result["compiled_ms"]:>13.1f}{result["speedup"]:>8.1f}x{body}'
+        )
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the compiled serializer against marshal')
+    parser.add_argument('--rows', type=int, default=10000, help='Rows per list')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case; the best is reported')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from .. import create_app
+    from ..config.config import config_dict
+
+    args = parse_args(argv)
+
+    class BenchmarkConfig(config_dict['test']):
+        SQLALCHEMY_ECHO = False
+
+    with create_app(config=BenchmarkConfig).app_context():
+        print(format_report(run(args.rows, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
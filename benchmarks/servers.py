@@ -0,0 +1,158 @@
+"""
+Compare the WSGI (runserver.py, gthread workers) and ASGI (asgi.py, uvicorn
+workers) serving modes on the read endpoints with async handlers, with the same
+number of worker processes, against a database seeded with run.py --seed:
+
+    python -m api.benchmarks.servers --database-url postgresql://localhost/bench --workers 2 \\
+        --concurrency 8,32,128
+
+Each mode is started with gunicorn, loaded at every concurrency level with the
+scenarios of run.py, then stopped. The report adds the peak resident memory of
+the server's processes (read from /proc, so on Linux only) to the throughput and
+latency of each level. Gains show with concurrency above the WSGI threads
+(workers * GUNICORN_THREADS) and with queries that wait on the database.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from .run import SCENARIOS, Dataset, RemoteClient, run_scenario, discover_enrollments
+
+
+SERVERS = {
+    'wsgi': 'api.runserver',
+    'asgi': 'api.asgi',
+}
+
+# Read scenarios served by async handlers in the ASGI mode
+ASYNC_SCENARIOS = ('students.list', 'students.list.after', 'students.get', 'courses.list')
+
+
+def process_tree_rss(pid):
+    """ Resident memory in bytes of a process and its descendants """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class MemorySampler(threading.Thread):
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def start_server(mode, database_url, workers, port):
+    module = SERVERS[mode]
+    env = dict(
+        os.environ, DATABASE_URL=database_url, GUNICORN_WORKERS=str(workers),
+        GUNICORN_BIND=f'127.0.0.1:{port}', DEBUG='False', RATELIMIT_ENABLED='False',
+    )
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', f'python:{module}', f'{module}:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/students?limit=1'):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not start within {timeout} seconds')
+
+
+def run(args):
+    results = []
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in ASYNC_SCENARIOS]
+    for mode in args.modes.split(','):
+        server = start_server(mode, args.database_url, args.workers, args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+        try:
+            wait_until_ready(base_url)
+            client = RemoteClient(base_url, {})
+            data = Dataset(args.students, args.courses, [], random.Random(args.random_seed))
+            data.enrollments = discover_enrollments(client, data) or [(1, 1)]
+            for concurrency in [int(level) for level in args.concurrency.split(',')]:
+                sampler = MemorySampler(server.pid)
+                sampler.start()
+                for scenario in scenarios:
+                    result = run_scenario(client, scenario, data, concurrency, args.requests)
+                    result['mode'] = mode
+                    result['rss_mb'] = 0.0
+                    results.append(result)
+                peak = sampler.stop() / 2 ** 20
+                for result in results[-len(scenarios):]:
+                    result['rss_mb'] = peak
+                print(format_report(results[-len(scenarios):]).split('\n', 2)[-1], file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def format_report(results):
+    header = f"{'mode':<6}{'scenario':<22}{'conc':>6}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'5xx':>6}{'RSS MB':>9}"
+    lines = [header, '-' * len(header)]
+    for r in results:
+        lines.append(
+            f"{r['mode']:<6}{r['scenario']:<22}{r['concurrency']:>6}{r['throughput']:>10.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['server_errors']:>6}{r['rss_mb']:>9.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Compare the WSGI and ASGI serving modes')
+    parser.add_argument('--database-url', required=True, help='A database seeded with run.py --seed')
+    parser.add_argument('--modes', default='wsgi,asgi', help='Comma separated modes to run')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes of both modes')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--students', type=int, default=100000, help='Students in the seeded database')
+    parser.add_argument('--courses', type=int, default=2000, help='Courses in the seeded database')
+    parser.add_argument('--concurrency', default='8,32,128', help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario and concurrency level')
+    parser.add_argument('--random-seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    print(format_report(run(parse_args(argv))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Cold start of the app: how long a new process takes to be ready, and where
+the time goes.
+
+    python -m api.benchmarks.startup --runs 10
+    python -m api.benchmarks.startup --imports 25
+    python -m api.benchmarks.startup --baseline startup.json --save-baseline
+    python -m api.benchmarks.startup --baseline startup.json --tolerance 0.2
+
+Every run is a fresh interpreter, so nothing is imported yet. Two scenarios:
+
+    prod     import the app, create_app with ProdConfig, then the first request
+             (GET /students?limit=1), as a web worker starts
+    test     import the app, then the setUp and tearDown of a test case
+             (tests/fixtures.py), twice: the first cycle, which creates the
+             app and the schema, is what a test run pays once, the second what
+             every test pays
+
+--imports reports where the import time of the prod scenario goes
+(python -X importtime), by module of the app and by package for the others,
+in self time so that nothing is counted twice.
+
+With --baseline the medians are compared to the saved ones and the command
+fails when a scenario is slower than the baseline by more than --tolerance;
+--save-baseline writes the medians of this run instead.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+
+PACKAGE = __package__.split('.')[0]
+
+CHILD = '''
+import json, sys, time
+scenario, database_url = sys.argv[1], sys.argv[2]
+timings = {}
+start = time.perf_counter()
+
+from %(package)s import create_app
+from %(package)s.config.config import config_dict
+from %(package)s.utils import db
+timings['import'] = time.perf_counter() - start
+
+if scenario == 'prod':
+    class BenchConfig(config_dict['prod']):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_BINDS = {}
+        if database_url.startswith('sqlite'):
+            SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    mark = time.perf_counter()
+    app = create_app(config=BenchConfig)
+    timings['create_app'] = time.perf_counter() - mark
+    if database_url.startswith('sqlite'):
+        with app.app_context():
+            db.create_all()
+    mark = time.perf_counter()
+    response = app.test_client().get('/students?limit=1')
+    timings['first_request'] = time.perf_counter() - mark
+    assert response.status_code == 200, response.status_code
+else:
+    from %(package)s.tests.fixtures import DatabaseTestCase
+
+    class Case(DatabaseTestCase):
+        def runTest(self):
+            pass
+
+    for phase in ('first_test', 'next_test'):
+        mark = time.perf_counter()
+        case = Case()
+        case.setUp()
+        case.tearDown()
+        timings[phase] = time.perf_counter() - mark
+
+print(json.dumps(timings))
+''' % {'package': PACKAGE}
+
+SCENARIOS = ('prod', 'test')
+
+
+def run_child(scenario, database_url, importtime=False):
+    """ The phase timings of one cold start, and the -X importtime report when asked for """
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD, scenario, database_url]
+    result = subprocess.run(
+        command, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'{scenario} start failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def import_breakdown(report):
+    """ Import self time in microseconds by module of the app and by top-level package of the others """
+    totals = defaultdict(int)
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        group = name if name.split('.')[0] == PACKAGE else name.split('.')[0]
+        totals[group] += int(self_us)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def run(args):
+    results = {}
+    for scenario in args.scenarios.split(','):
+        runs = [run_child(scenario, args.database_url)[0] for _ in range(args.runs)]
+        phases = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+        results[scenario] = {
+            'phases': phases,
+            'total': statistics.median(sum(run.values()) for run in runs),
+        }
+    return results
+
+
+def format_report(results):
+    lines = []
+    for scenario, result in results.items():
+        phases = '  '.join(f"{phase} {seconds * 1000:.1f}" for phase, seconds in result['phases'].items())
+        lines.append(f"{scenario:<6}{result['total'] * 1000:>9.1f} ms   ({phases})")
+    return '\n'.join(lines)
+
+
+def format_imports(breakdown, top):
+    total = sum(us for _, us in breakdown)
+    lines = [f"{'module or package':<40}{'self ms':>9}{'share':>8}", '-' * 57]
+    for name, us in breakdown[:top]:
+        lines.append(f"{name:<40}{us / 1000:>9.1f}{us / total:>8.1%}")
+    app_us = sum(us for name, us in breakdown if name.split('.')[0] == PACKAGE)
+    lines.append(f"{'total (app modules: ' + format(app_us / 1000, '.1f') + ' ms)':<40}{total / 1000:>9.1f}")
+    return '\n'.join(lines)
+
+
+def check_baseline(results, baseline, tolerance):
+    """ The scenarios slower than their baseline by more than `tolerance` """
+    return [
+        f"{scenario}: {result['total'] * 1000:.1f} ms, baseline {baseline[scenario] * 1000:.1f} ms"
+        for scenario, result in results.items()
+        if scenario in baseline and result['total'] > baseline[scenario] * (1 + tolerance)
+    ]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Measure the cold start of the app')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios to run')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per scenario; medians are reported')
+    parser.add_argument('--database-url', help='Database of the prod scenario (default: a temporary SQLite file)')
+    parser.add_argument('--imports', type=int, metavar='N', help='Report the N largest import times instead')
+    parser.add_argument('--baseline', help='JSON file of the median times to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the medians to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown over the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        args.database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'startup.sqlite3')}"
+        if args.imports:
+            _, report = run_child('prod', args.database_url, importtime=True)
+            print(format_imports(import_breakdown(report), args.imports))
+            return
+        results = run(args)
+    print(format_report(results))
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as baseline:
+            json.dump({scenario: result['total'] for scenario, result in results.items()}, baseline, indent=2)
+    elif args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = check_baseline(results, json.load(baseline), args.tolerance)
+        if regressions:
+            sys.exit('Cold start regressed:\n' + '\n'.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 import os
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 
@@ -14,26 +14,108 @@ if uri.startswith("postgres://"):
     uri = uri.replace("postgres://", "postgresql://", 1)
 # rest of connection code using the connection string `uri`
 
+# Read replicas, as comma separated URLs. GET requests read from them (see
+# utils/routing.py); each becomes a "replica_<n>" bind, with the same engine
+# options (and so the same pool size, on its own server) as the primary.
+replica_binds = {
+    f'replica_{n}': replica_uri.replace("postgres://", "postgresql://", 1)
+    for n, replica_uri in enumerate(config("DATABASE_REPLICA_URLS", "", cast=Csv()))
+}
+
+# Connection pool of each worker process. A worker holds at most
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections; runserver.py sizes the
+# gunicorn preset so all workers together stay under DB_MAX_CONNECTIONS.
+DB_POOL_SIZE = config('DB_POOL_SIZE', 5, cast=int)
+DB_MAX_OVERFLOW = config('DB_MAX_OVERFLOW', 5, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', 10, cast=int)  # seconds to wait for a free connection
+DB_POOL_RECYCLE = config('DB_POOL_RECYCLE', 1800, cast=int)  # seconds before a connection is replaced
+DB_POOL_PRE_PING = config('DB_POOL_PRE_PING', True, cast=bool)  # detect connections dropped by failovers
+DB_MAX_CONNECTIONS = config('DB_MAX_CONNECTIONS', 90, cast=int)  # connections available to this app
+
+# ASGI mode (asgi.py): the async handlers of a worker share one pool of the
+# async driver, on top of the pool of the threads serving the other endpoints.
+ASYNC_DB_POOL_SIZE = config('ASYNC_DB_POOL_SIZE', 10, cast=int)
+ASYNC_DB_MAX_OVERFLOW = config('ASYNC_DB_MAX_OVERFLOW', 10, cast=int)
+
 
 class Config:
     SECRET_KEY = config('SECRET_KEY', 'secret')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    API_LAZY_NAMESPACES = config('API_LAZY_NAMESPACES', True, cast=bool)  # import the views on the first request
+    PAGINATION_DEFAULT_LIMIT = config('PAGINATION_DEFAULT_LIMIT', 50, cast=int)
+    PAGINATION_MAX_LIMIT = config('PAGINATION_MAX_LIMIT', 500, cast=int)
+    BULK_ENROLLMENT_MAX_PAIRS = config('BULK_ENROLLMENT_MAX_PAIRS', 5000, cast=int)
+    BULK_REGISTRATION_MAX_RECORDS = config('BULK_REGISTRATION_MAX_RECORDS', 5000, cast=int)
+    GRADE_UPLOAD_CHUNK_SIZE = config('GRADE_UPLOAD_CHUNK_SIZE', 1000, cast=int)
+    GRADE_UPLOAD_MAX_ERRORS = config('GRADE_UPLOAD_MAX_ERRORS', 100, cast=int)
+    CACHE_TYPE = config('CACHE_TYPE', 'lru')  # lru, redis or null
+    CACHE_REDIS_URL = config('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TTL = config('CACHE_DEFAULT_TTL', 300, cast=int)
+    CACHE_MAX_ENTRIES = config('CACHE_MAX_ENTRIES', 10000, cast=int)
+    METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', False, cast=bool)
+    METRICS_TOKEN = config('METRICS_TOKEN', '')  # bearer token of the scraper of /admin/metrics, besides teachers
+    EXPORT_BATCH_SIZE = config('EXPORT_BATCH_SIZE', 5000, cast=int)
+    JOBS_EAGER = config('JOBS_EAGER', False, cast=bool)  # run jobs in the request, without a worker
+    JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', 3, cast=int)
+    JOBS_RETRY_DELAY = config('JOBS_RETRY_DELAY', 10, cast=int)  # seconds, doubled after each failed attempt
+    JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', 1.0, cast=float)
+    JOBS_TIMEOUT = config('JOBS_TIMEOUT', 600, cast=int)  # seconds before a running job is considered abandoned
+    JOBS_BATCH_MAX_ITEMS = config('JOBS_BATCH_MAX_ITEMS', 100, cast=int)
+    REPLICA_HEALTH_CHECK_INTERVAL = config('REPLICA_HEALTH_CHECK_INTERVAL', 30, cast=int)  # seconds
+    IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', 86400, cast=int)  # seconds a response is replayed for
+    REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', 5, cast=int)  # primary reads after a client's write
+    ASYNC_DATABASE_URL = config('ASYNC_DATABASE_URL', '')  # default: the primary with asyncpg or aiosqlite
+    ASGI_THREADS = config('ASGI_THREADS', DB_POOL_SIZE, cast=int)  # threads of the endpoints without async handlers
+    COMPRESS_ENABLED = config('COMPRESS_ENABLED', True, cast=bool)
+    COMPRESS_MIN_SIZE = config('COMPRESS_MIN_SIZE', 500, cast=int)  # bytes; smaller bodies are sent as they are
+    COMPRESS_LEVEL = config('COMPRESS_LEVEL', 6, cast=int)  # gzip and deflate, 1-9
+    COMPRESS_BROTLI_QUALITY = config('COMPRESS_BROTLI_QUALITY', 4, cast=int)  # 0-11; higher is much slower
+    RATELIMIT_ENABLED = config('RATELIMIT_ENABLED', True, cast=bool)
+    RATELIMIT_STORAGE = config('RATELIMIT_STORAGE', 'memory')  # memory (per worker) or redis (shared by all workers)
+    RATELIMIT_REDIS_URL = config('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    # Reverse proxies in front of the app (e.g. 1 for nginx): clients are told apart by the
+    # address the outermost one saw, from X-Forwarded-For, instead of by the proxy's own
+    RATELIMIT_TRUSTED_PROXIES = config('RATELIMIT_TRUSTED_PROXIES', 0, cast=int)
+    # Token buckets per client of the write endpoints, by namespace and for the bulk
+    # endpoints: "<requests>/<second|minute|hour>", bursts of up to <requests>
+    RATELIMITS = {
+        'students': config('RATELIMIT_STUDENTS', '60/minute'),
+        'courses': config('RATELIMIT_COURSES', '60/minute'),
+        'bulk': config('RATELIMIT_BULK', '10/minute'),
+    }
 
 class DevConfig(Config):
     SQLALCHEMY_DATABASE_URI="sqlite:///"+os.path.join(BASE_DIR,'db.sqlite3')
     SQLALCHEMY_TRACK_MODIFICATIONS=False
+    SQLALCHEMY_BINDS = replica_binds
     SQLALCHEMY_ECHO=True
     DEBUG=True
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = False
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    JOBS_EAGER = True
 
 class ProdConfig(Config):
     SQLALCHEMY_DATABASE_URI=uri
     SQLALCHEMY_TRACK_MODIFICATIONS=False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    ASYNC_ENGINE_OPTIONS = {
+        'pool_size': ASYNC_DB_POOL_SIZE,
+        'max_overflow': ASYNC_DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    SQLALCHEMY_BINDS = replica_binds
     DEBUG=config('DEBUG', False, cast=bool)
 
 
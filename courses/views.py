@@ -1,8 +1,21 @@
-from flask_restx import Namespace, Resource, fields, marshal
-from flask import request
+from flask_restx import Namespace, Resource, fields, marshal, reqparse, inputs
+from sqlalchemy.exc import IntegrityError
+from flask import request, current_app
 from ..models.students import Student
 from ..models.studentcourse import StudentCourse
 from ..models.courses import Course
+from ..models.search import search_courses, search_courses_async
+from ..decorators.decorator import teacher_required
+from ..utils.pagination import get_page_args, pagination_parser, search_parser, get_search_args
+from ..utils.conditional import get_validators, not_modified, conditional_headers
+from ..utils.export import export_response, EXPORT_MIMETYPES
+from ..utils.serializer import serialize_with, compile_model, requested_fields
+from ..utils.async_db import async_db
+from ..utils.ratelimit import limiter
+from ..utils.cache import cache
+from ..models.grade import Score
+from ..jobs.queue import enqueue
+from ..utils import db
 from http import HTTPStatus
 
 
@@ -36,19 +49,107 @@ student_course_model = courses_namespace.model(
 )
 
 
+enrollment_pair_model = courses_namespace.model(
+    'EnrollmentPair', {
+        'student_id': fields.Integer(required=True, description="Student's User ID"),
+        'course_id': fields.Integer(required=True, description="Course's ID")
+    }
+)
+
+
+bulk_enrollment_model = courses_namespace.model(
+    'BulkEnrollment', {
+        'enrollments': fields.List(fields.Nested(enrollment_pair_model), required=True,
+                                   description="(student_id, course_id) pairs to enroll")
+    }
+)
+
+
+bulk_enrollment_result_model = courses_namespace.model(
+    'BulkEnrollmentResult', {
+        'student_id': fields.Integer(description="Student's User ID"),
+        'course_id': fields.Integer(description="Course's ID"),
+        'status': fields.String(description="enrolled, already_enrolled, duplicate, student_not_found or course_not_found")
+    }
+)
+
+
+job_accepted_model = courses_namespace.model(
+    'CourseJobAccepted', {
+        'message': fields.String(description="What was queued"),
+        'job_id': fields.Integer(description="ID of the job to poll at /jobs/<job_id>")
+    }
+)
+
+
+course_statistics_model = courses_namespace.model(
+    'CourseStatistics', {
+        'course_id': fields.Integer(description="Course's ID"),
+        'enrolled': fields.Integer(description="Number of enrolled students"),
+        'graded': fields.Integer(description="Number of graded students"),
+        'histogram': fields.Raw(description="Number of students per grade", example={'A': 3, 'B': 5}),
+        'mean_gpa': fields.Float(description="Mean GPA of the graded students"),
+        'median_gpa': fields.Float(description="Median GPA of the graded students"),
+        'percentiles': fields.Raw(description="GPA at the 10th, 25th, 50th, 75th and 90th percentiles",
+                                  example={'10': 1.0, '25': 2.0, '50': 3.0, '75': 4.0, '90': 4.0}),
+    }
+)
+
+
+export_parser = reqparse.RequestParser()
+export_parser.add_argument('format', choices=tuple(EXPORT_MIMETYPES), default='ndjson', location='args',
+                           help='ndjson or csv')
+export_parser.add_argument('course_id', type=int, location='args', help='Only export this course')
+export_parser.add_argument('since', type=inputs.datetime_from_iso8601, location='args',
+                           help='Only rows created at or after this ISO 8601 date, e.g. the start of a term')
+export_parser.add_argument('until', type=inputs.datetime_from_iso8601, location='args',
+                           help='Only rows created before this ISO 8601 date, e.g. the end of a term')
+
+
+def export_statement(model, columns, args):
+    statement = db.select(*columns).order_by(model.id)
+    if args['course_id'] is not None:
+        statement = statement.where(model.course_id == args['course_id'])
+    if args['since'] is not None:
+        statement = statement.where(model.created_at >= args['since'])
+    if args['until'] is not None:
+        statement = statement.where(model.created_at < args['until'])
+    return statement
+
+
 @courses_namespace.route('')
 class GetCreateCourses(Resource):
-    @courses_namespace.marshal_with(course_model)
+    @courses_namespace.expect(pagination_parser)
+    @serialize_with(courses_namespace, course_model, as_list=True)
     @courses_namespace.doc(
-        description='Get all courses'
+        description='Get all courses, one page at a time ordered by ID. '
+                    'Answers 304 when If-None-Match matches the page.'
     )
     def get(self):
         """
             Get All Courses
         """
-        courses = Course.query.all()
-
-        return courses, HTTPStatus.OK
+        limit, after = get_page_args()
+        return self.page_response(Course.get_page(limit, after))
+
+    @serialize_with(courses_namespace, course_model, as_list=True)
+    async def async_get(self):
+        """ get, in the ASGI mode (utils/asgi.py) """
+        limit, after = get_page_args()
+        async with async_db.session() as session:
+            page = await Course.get_page_async(session, limit, after)
+        return self.page_response(page)
+
+    @staticmethod
+    def page_response(page):
+        # ETag only: a deleted row changes the page without moving its latest updated_at
+        etag, _ = get_validators(page.items, page.next_cursor)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        headers = dict(page.headers(), **conditional_headers(etag))
+        return page.items, HTTPStatus.OK, headers
     
 
     @courses_namespace.expect(course_model)
@@ -80,12 +181,39 @@ class GetCreateCourses(Resource):
 
     
 
+@courses_namespace.route('/search')
+class SearchCourses(Resource):
+    @courses_namespace.expect(search_parser)
+    @serialize_with(courses_namespace, course_model, as_list=True)
+    @courses_namespace.doc(
+        description='Search courses by name: each word of `q` matches the start of a word of the name '
+                    '(Postgres also matches misspellings), best matches first. '
+                    'Pass the X-Next-Cursor response header as `after` to get the next page.'
+    )
+    def get(self):
+        """
+            Search Courses
+        """
+        term, limit, offset = get_search_args()
+        page = search_courses(term, limit, offset, requested_fields(course_model))
+        return page.items, HTTPStatus.OK, page.headers()
+
+    @serialize_with(courses_namespace, course_model, as_list=True)
+    async def async_get(self):
+        """ get, in the ASGI mode (utils/asgi.py) """
+        term, limit, offset = get_search_args()
+        async with async_db.session() as session:
+            page = await search_courses_async(session, term, limit, offset, requested_fields(course_model))
+        return page.items, HTTPStatus.OK, page.headers()
+
+
 @courses_namespace.route('/<int:course_id>')
 class GetUpdateDeleteCourse(Resource):
     
-    @courses_namespace.marshal_with(course_model)
+    @courses_namespace.response(HTTPStatus.OK, 'Success', course_model)
     @courses_namespace.doc(
-        description="Retrieve a course's details by its ID",
+        description="Retrieve a course's details by its ID. "
+                    "Answers 304 when If-None-Match or If-Modified-Since match the course.",
         params = {
             'course_id': "The Course's ID"
         }
@@ -95,9 +223,14 @@ class GetUpdateDeleteCourse(Resource):
         """
             Retrieve a Course's details by Id
         """
-        course = Course.query.filter_by(id=course_id).first()
+        course = Course.get_by_id(course_id)
+
+        etag, last_modified = get_validators([course])
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
         
-        return course, HTTPStatus.OK
+        return marshal(course, course_model), HTTPStatus.OK, conditional_headers(etag, last_modified)
     
     @courses_namespace.expect(course_model)
     @courses_namespace.marshal_with(course_model)
@@ -117,8 +250,11 @@ class GetUpdateDeleteCourse(Resource):
         course.save()
         return course, HTTPStatus.OK
     
+    @courses_namespace.response(HTTPStatus.ACCEPTED, 'Deletion queued', job_accepted_model)
     @courses_namespace.doc(
-        description='Delete a course by ID!',
+        description="Delete a course by ID, with its enrollments and scores. "
+                    "With a shared cache (CACHE_TYPE redis or null) the deletion runs in the background; "
+                    "poll /jobs/<job_id> for its outcome.",
         params = {
             'course_id': "The Course's ID"
         }
@@ -130,13 +266,55 @@ class GetUpdateDeleteCourse(Resource):
         """
         course = Course.get_by_id(course_id)
 
-        course.delete()
+        # The job invalidates the cache of the process running it: when each process has its own
+        # cache, a worker's invalidation would never reach this one, so the deletion runs here
+        job = enqueue('course.delete', {'course_id': course.id}, eager=True if cache.local else None)
+
+        return {"message": "Course Deletion Queued", "job_id": job.id}, HTTPStatus.ACCEPTED
+
+
+@courses_namespace.route('/statistics')
+class CoursesStatistics(Resource):
+
+    @serialize_with(courses_namespace, course_statistics_model, as_list=True)
+    @courses_namespace.doc(
+        description="Enrollment and grade statistics of every course, computed in one pass"
+    )
+    @teacher_required()
+    def get(self):
+        """
+            Get Statistics of all Courses
+        """
+        statistics = StudentCourse.get_course_statistics()
+
+        return [statistics[course_id] for course_id in sorted(statistics)], HTTPStatus.OK
 
-        return {"message": "Course Successfully Deleted"}, HTTPStatus.OK
+
+@courses_namespace.route('/<int:course_id>/statistics')
+class CourseStatistics(Resource):
+
+    @courses_namespace.marshal_with(course_statistics_model)
+    @courses_namespace.doc(
+        description="Enrollment count, grade histogram, mean/median GPA and percentiles of a course",
+        params = {
+            'course_id': "The Course's ID"
+        }
+    )
+    @teacher_required()
+    def get(self, course_id):
+        """
+            Get a Course's Statistics
+        """
+        course = Course.get_by_id(course_id)
+
+        statistics = StudentCourse.get_course_statistics([course.id])
+
+        return statistics[course.id], HTTPStatus.OK
 
 
 @courses_namespace.route('/<int:course_id>/students')
 class StudentCourseEnrollment(Resource):
+    @serialize_with(courses_namespace, list_student_course_model, as_list=True)
     @courses_namespace.doc(
         description="Get all students who enrolled for a course!",
         params = {
@@ -149,19 +327,8 @@ class StudentCourseEnrollment(Resource):
             Get all Students Enrolled for a Course!
         """
         students = StudentCourse.get_students_in_course_by(course_id)
-        course = Course.query.filter_by(id=course_id).first()
-
-        resp = []
-
-        for student in students:
-            student_resp = {}
-            student_resp['id'] = student.id
-            student_resp['course_name'] = course.name
-            student_resp['full_name'] = student.full_name
 
-            resp.append(student_resp)
-
-        return marshal(resp, list_student_course_model), HTTPStatus.OK
+        return students, HTTPStatus.OK
 
 @courses_namespace.route('/<int:course_id>/students/<int:student_id>')
 class StudentCourseRemoval(Resource):
@@ -199,6 +366,7 @@ class StudentEnrollment(Resource):
             'student_id': "The Course's ID"
         }
     )
+    @limiter.limit('courses')
     @teacher_required()
     def post(self):
         """
@@ -212,6 +380,88 @@ class StudentEnrollment(Resource):
             student_id=data['student_id']
         )
 
-        enrolled_student.save()
+        try:
+            enrolled_student.save()
+        except IntegrityError:
+            db.session.rollback()
+            return {"message": "Student is already enrolled for this course"}, HTTPStatus.CONFLICT
+
+        return {"message": "You have Successfully Been Enrolled"}, HTTPStatus.CREATED
+
+
+@courses_namespace.route('/students/batch')
+class BulkStudentEnrollment(Resource):
+
+    @courses_namespace.expect(bulk_enrollment_model, validate=True)
+    @courses_namespace.doc(
+        description="Enroll many Students to many Courses in a single transaction!"
+    )
+    @limiter.limit('bulk')
+    @teacher_required()
+    def post(self):
+        """
+            Enroll Students for Courses in bulk!
+        """
+        data = courses_namespace.payload
+        pairs = [(item['student_id'], item['course_id']) for item in data['enrollments']]
+
+        max_pairs = current_app.config.get('BULK_ENROLLMENT_MAX_PAIRS', 5000)
+        if len(pairs) > max_pairs:
+            return {"message": f"At most {max_pairs} enrollments are allowed per request"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+        try:
+            statuses = StudentCourse.bulk_enroll(pairs)
+        except IntegrityError:
+            db.session.rollback()
+            return {"message": "Enrollments changed concurrently, please retry"}, HTTPStatus.CONFLICT
+
+        results = [
+            {'student_id': student_id, 'course_id': course_id, 'status': status}
+            for (student_id, course_id), status in zip(pairs, statuses)
+        ]
+        return {
+            "enrolled": statuses.count('enrolled'),
+            "results": compile_model(bulk_enrollment_result_model)(results)
+        }, HTTPStatus.OK
+
+
+@courses_namespace.route('/export/enrollments')
+class EnrollmentsExport(Resource):
+
+    @courses_namespace.expect(export_parser)
+    @courses_namespace.doc(
+        description="Stream every enrollment as NDJSON or CSV, optionally for one course or term"
+    )
+    @teacher_required()
+    def get(self):
+        """
+            Export Enrollments
+        """
+        args = export_parser.parse_args()
+        statement = export_statement(StudentCourse, [
+            StudentCourse.id, StudentCourse.student_id, StudentCourse.course_id,
+            StudentCourse.created_at, StudentCourse.updated_at
+        ], args)
+
+        return export_response(statement, args['format'], 'enrollments')
+
+
+@courses_namespace.route('/export/scores')
+class ScoresExport(Resource):
+
+    @courses_namespace.expect(export_parser)
+    @courses_namespace.doc(
+        description="Stream every score as NDJSON or CSV, optionally for one course or term"
+    )
+    @teacher_required()
+    def get(self):
+        """
+            Export Scores
+        """
+        args = export_parser.parse_args()
+        statement = export_statement(Score, [
+            Score.id, Score.student_id, Score.course_id, Score.grade, Score.created_at, Score.updated_at
+        ], args)
+
+        return export_response(statement, args['format'], 'scores')
 
-        return {"message": "You have Successfully Been Enrolled"}, HTTPStatus.CREATED
\ No newline at end of file
@@ -0,0 +1,54 @@
+from ..models.courses import Course
+from ..models.studentcourse import StudentCourse
+from ..models.grade import Score
+from ..models.transcript import Transcript
+from ..utils import db
+
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Register a function as the handler of a job kind; it is called with the
+    job's payload as keyword arguments and returns a JSON serializable result.
+    A job may run again after a worker dies mid-way, so handlers are idempotent.
+    """
+    def decorator(function):
+        HANDLERS[kind] = function
+        return function
+    return decorator
+
+
+@handler('course.delete')
+def delete_course(course_id):
+    """ Delete a course with its enrollments and scores, one statement per table """
+    graded = [
+        student_id for (student_id,) in
+        db.session.query(Score.student_id).filter(Score.course_id == course_id).distinct()
+    ]
+    scores = db.session.query(Score).filter(Score.course_id == course_id).delete(synchronize_session=False)
+    enrollments = (
+        db.session.query(StudentCourse).filter(StudentCourse.course_id == course_id)
+        .delete(synchronize_session=False)
+    )
+    deleted = db.session.query(Course).filter(Course.id == course_id).delete(synchronize_session=False)
+    if graded:
+        Transcript.refresh(graded, commit=False)
+    db.session.commit()
+    Course.invalidate_cache(course_id)
+    return {'deleted': deleted, 'enrollments': enrollments, 'scores': scores}
+
+
+@handler('scores.grade')
+def grade_scores(grades, lines, rejected=0, errors=()):
+    """
+    Save one chunk of a bulk grade upload. `lines` holds the upload line of each
+    grade; `rejected` and `errors` describe the lines already rejected when the
+    upload was parsed.
+    """
+    errors = list(errors)
+    inserted, updated, not_enrolled = StudentCourse.bulk_grade([tuple(grade) for grade in grades]) if grades else (0, 0, [])
+    for position in not_enrolled:
+        errors.append({'line': lines[position], 'message': 'The student is not registered for this course'})
+    return {'inserted': inserted, 'updated': updated, 'rejected': rejected + len(not_enrolled), 'errors': errors}
@@ -0,0 +1,204 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from ..models.job import Job
+from ..models.idempotency import IdempotencyKey
+from ..utils import db
+from ..utils.metrics import metrics
+from .handlers import HANDLERS
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(kind, payload, batch=None, held=False, eager=None):
+    """
+    Save a job for the worker and commit. With JOBS_EAGER (tests and local
+    development without a worker), or `eager`, the job also runs right away in
+    this thread. A `held` job waits, neither claimed nor run, until
+    release_batch queues its batch (or cancel_batch cancels it).
+    """
+    if kind not in HANDLERS:
+        raise LookupError(f'No handler for job kind {kind!r}')
+    job = Job(kind=kind, payload=payload, batch=batch, status=Job.HELD if held else Job.QUEUED,
+              max_attempts=current_app.config.get('JOBS_MAX_ATTEMPTS', 3))
+    job.save()
+    metrics.increment('jobs_enqueued', kind=kind)
+
+    if eager is None:
+        eager = current_app.config.get('JOBS_EAGER', False)
+    if not held and eager:
+        start(job, 'eager')
+        run(job)
+    return job
+
+
+def release_batch(batch):
+    """ Queue the held jobs of `batch` and commit; with JOBS_EAGER they run right away """
+    released = (
+        db.session.query(Job)
+        .filter(Job.batch == batch, Job.status == Job.HELD)
+        .update({Job.status: Job.QUEUED, Job.run_after: datetime.utcnow()}, synchronize_session=False)
+    )
+    db.session.commit()
+
+    if current_app.config.get('JOBS_EAGER', False):
+        job_ids = [
+            job_id for job_id, in
+            db.session.query(Job.id).filter(Job.batch == batch, Job.status == Job.QUEUED).order_by(Job.id)
+        ]
+        for job_id in job_ids:
+            job = db.session.get(Job, job_id)
+            start(job, 'eager')
+            run(job)
+    return released
+
+
+def cancel_batch(batch):
+    """ Cancel the held jobs of `batch` and commit """
+    cancelled = (
+        db.session.query(Job)
+        .filter(Job.batch == batch, Job.status == Job.HELD)
+        .update({Job.status: Job.CANCELLED, Job.finished_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    db.session.commit()
+    return cancelled
+
+
+def start(job, worker):
+    job.status = Job.RUNNING
+    job.worker = worker
+    job.attempts += 1
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+
+def claim(worker):
+    """
+    Take the oldest job that is due and mark it running. The candidate row is
+    locked with SKIP LOCKED where the database supports it, and the status
+    change only applies while the job is still queued, so two workers never
+    run the same job.
+    """
+    candidate = (
+        db.session.query(Job.id)
+        .filter(Job.status == Job.QUEUED, Job.run_after <= datetime.utcnow())
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar()
+    )
+    if candidate is None:
+        db.session.rollback()
+        return None
+
+    claimed = (
+        db.session.query(Job)
+        .filter(Job.id == candidate, Job.status == Job.QUEUED)
+        .update({
+            Job.status: Job.RUNNING,
+            Job.worker: worker,
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: datetime.utcnow(),
+        }, synchronize_session=False)
+    )
+    db.session.commit()
+    return db.session.get(Job, candidate) if claimed else None
+
+
+def run(job):
+    """
+    Run a claimed job and record its result. A failed job goes back to the
+    queue with an exponential backoff until it has used all its attempts.
+    """
+    job_id = job.id
+    started = time.perf_counter()
+    try:
+        result = HANDLERS[job.kind](**job.payload)
+    except Exception:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, job.kind)
+        job = db.session.get(Job, job_id)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = current_app.config.get('JOBS_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+            job.status = Job.QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = datetime.utcnow()
+    else:
+        job = db.session.get(Job, job_id)
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.error = None
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+    metrics.increment('jobs_finished', kind=job.kind, status=job.status)
+    metrics.increment('jobs_duration_seconds', time.perf_counter() - started, kind=job.kind)
+    return job
+
+
+def requeue_stale(timeout):
+    """ Put back jobs left running by a worker that died more than `timeout` seconds ago """
+    stale = db.session.query(Job).filter(
+        Job.status == Job.RUNNING,
+        Job.started_at < datetime.utcnow() - timedelta(seconds=timeout)
+    )
+    requeued = stale.filter(Job.attempts < Job.max_attempts).update(
+        {Job.status: Job.QUEUED, Job.run_after: datetime.utcnow()}, synchronize_session=False
+    )
+    failed = stale.filter(Job.attempts >= Job.max_attempts).update(
+        {Job.status: Job.FAILED, Job.finished_at: datetime.utcnow(), Job.error: 'Worker timed out'},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return requeued + failed
+
+
+class Worker:
+    """
+    Polls the jobs table and runs one job at a time; start as many worker
+    processes as needed (see runworker.py). Every so often it also requeues
+    abandoned jobs and deletes expired idempotency keys. Must run in an
+    application context.
+    """
+
+    def __init__(self, name=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.running = False
+
+    def stop(self, *args):
+        """ Finish the current job, then return from work(); usable as a signal handler """
+        self.running = False
+
+    def work(self, burst=False):
+        """ Run jobs until stopped, or with `burst` until the queue is empty """
+        poll_interval = current_app.config.get('JOBS_POLL_INTERVAL', 1.0)
+        timeout = current_app.config.get('JOBS_TIMEOUT', 600)
+        next_requeue = 0
+        self.running = True
+        while self.running:
+            if time.monotonic() >= next_requeue:
+                requeue_stale(timeout)
+                IdempotencyKey.purge(
+                    datetime.utcnow() - timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+                )
+                next_requeue = time.monotonic() + timeout / 10
+
+            job = claim(self.name)
+            if job is None:
+                if burst:
+                    break
+                time.sleep(poll_interval)
+                continue
+            run(job)
+            # Each job starts from a clean session
+            db.session.remove()
+        self.running = False
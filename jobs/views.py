@@ -0,0 +1,107 @@
+from flask import current_app
+from flask_restx import Namespace, Resource, fields
+from ..models.job import Job
+from ..decorators.decorator import teacher_required
+from http import HTTPStatus
+
+
+jobs_namespace = Namespace('jobs', description='Namespace for background jobs')
+
+job_model = jobs_namespace.model(
+    'Job', {
+        'id': fields.Integer(description="Job's ID"),
+        'kind': fields.String(description="What the job does, e.g. course.delete"),
+        'status': fields.String(description="held, queued, running, succeeded, failed or cancelled"),
+        'batch': fields.String(description="Batch the job belongs to, if any"),
+        'attempts': fields.Integer(description="Number of times the job was started"),
+        'result': fields.Raw(description="Result of a succeeded job"),
+        'error': fields.String(description="Last error of a job that failed"),
+        'created_at': fields.DateTime(description="When the job was enqueued"),
+        'started_at': fields.DateTime(description="When the last attempt started"),
+        'finished_at': fields.DateTime(description="When the job succeeded or failed for good"),
+    }
+)
+
+job_batch_model = jobs_namespace.model(
+    'JobBatch', {
+        'batch': fields.String(description="Batch ID"),
+        'status': fields.String(description="succeeded, failed or cancelled once every job is done, else running"),
+        'jobs': fields.Raw(description="Number of jobs per status", example={'succeeded': 3, 'queued': 1}),
+        'result': fields.Raw(description="Results of the succeeded jobs, with numbers added up and lists concatenated"),
+    }
+)
+
+
+def combine_results(results, max_items):
+    """ Merge job results: numbers are added up and lists concatenated up to `max_items` """
+    combined = {}
+    for result in results:
+        for key, value in (result or {}).items():
+            if isinstance(value, list):
+                items = combined.setdefault(key, [])
+                items.extend(value[:max_items - len(items)])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                combined[key] = combined.get(key, 0) + value
+    return combined
+
+
+def summarize_batch(batch, jobs):
+    counts = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+
+    if counts.get(Job.HELD) or counts.get(Job.QUEUED) or counts.get(Job.RUNNING):
+        status = Job.RUNNING
+    elif counts.get(Job.FAILED):
+        status = Job.FAILED
+    elif counts.get(Job.CANCELLED):
+        status = Job.CANCELLED
+    else:
+        status = Job.SUCCEEDED
+
+    max_items = current_app.config.get('JOBS_BATCH_MAX_ITEMS', 100)
+    return {
+        'batch': batch,
+        'status': status,
+        'jobs': counts,
+        'result': combine_results([job.result for job in jobs if job.status == Job.SUCCEEDED], max_items),
+    }
+
+
+@jobs_namespace.route('/<int:job_id>')
+class JobView(Resource):
+
+    @jobs_namespace.marshal_with(job_model)
+    @jobs_namespace.doc(
+        description="Poll the status of a background job",
+        params = {
+            'job_id': "The Job's ID"
+        }
+    )
+    @teacher_required()
+    def get(self, job_id):
+        """
+            Retrieve a Job's status by ID
+        """
+        return Job.get_by_id(job_id), HTTPStatus.OK
+
+
+@jobs_namespace.route('/batches/<string:batch>')
+class JobBatchView(Resource):
+
+    @jobs_namespace.marshal_with(job_batch_model)
+    @jobs_namespace.doc(
+        description="Poll the combined status and results of the jobs enqueued by one request",
+        params = {
+            'batch': "The batch ID returned when the jobs were enqueued"
+        }
+    )
+    @teacher_required()
+    def get(self, batch):
+        """
+            Retrieve a Job batch's status
+        """
+        jobs = Job.get_batch(batch)
+        if not jobs:
+            jobs_namespace.abort(HTTPStatus.NOT_FOUND, 'Batch not found')
+        return summarize_batch(batch, jobs), HTTPStatus.OK
@@ -0,0 +1,58 @@
+"""index join tables and course name
+
+Adds a unique (student_id, course_id) constraint and a course_id index to
+student_course and scores, and an index on courses.name. Duplicate pairs
+are removed first: the oldest enrollment and the latest score are kept.
+
+This is the first revision: it upgrades the tables of a database created
+before the migrations. A new database is created with db.create_all and
+stamped with the head revision instead (see README).
+
+Revision ID: 5b1f0c7e2a91
+Revises: 
+Create Date: 2026-10-18 18:02:11.413904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7e2a91'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM student_course WHERE id NOT IN "
+        "(SELECT MIN(id) FROM student_course GROUP BY student_id, course_id)"
+    )
+    op.execute(
+        "DELETE FROM scores WHERE id NOT IN "
+        "(SELECT MAX(id) FROM scores GROUP BY student_id, course_id)"
+    )
+
+    with op.batch_alter_table('student_course', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_student_course_student_id_course_id', ['student_id', 'course_id'])
+        batch_op.create_index('ix_student_course_course_id', ['course_id'], unique=False)
+
+    with op.batch_alter_table('scores', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_scores_student_id_course_id', ['student_id', 'course_id'])
+        batch_op.create_index('ix_scores_course_id', ['course_id'], unique=False)
+
+    with op.batch_alter_table('courses', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_courses_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('courses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_courses_name'))
+
+    with op.batch_alter_table('scores', schema=None) as batch_op:
+        batch_op.drop_index('ix_scores_course_id')
+        batch_op.drop_constraint('uq_scores_student_id_course_id', type_='unique')
+
+    with op.batch_alter_table('student_course', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_course_course_id')
+        batch_op.drop_constraint('uq_student_course_student_id_course_id', type_='unique')
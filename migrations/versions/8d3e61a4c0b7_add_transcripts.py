@@ -0,0 +1,36 @@
+"""add transcripts
+
+Transcripts of students graded before this revision are built from their
+scores the first time they are read.
+
+Revision ID: 8d3e61a4c0b7
+Revises: 5b1f0c7e2a91
+Create Date: 2026-10-18 18:41:52.106231
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3e61a4c0b7'
+down_revision = '5b1f0c7e2a91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('transcripts',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('credits', sa.Integer(), nullable=False),
+    sa.Column('grade_points', sa.Float(), nullable=False),
+    sa.Column('gpa', sa.Float(), nullable=True),
+    sa.Column('grades', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('student_id')
+    )
+
+
+def downgrade():
+    op.drop_table('transcripts')
@@ -0,0 +1,65 @@
+"""add search indexes on student names and emails and course names
+
+Postgres: pg_trgm GIN indexes. SQLite: external content FTS5 tables, filled
+from the existing rows and kept in sync by triggers (a batch migration that
+rebuilds students or courses drops the triggers and must create them again).
+
+Revision ID: a6d40c93b7e5
+Revises: f19c3b6d8e24
+Create Date: 2026-10-18 18:09:52.504211
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d40c93b7e5'
+down_revision = 'f19c3b6d8e24'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_COLUMNS = {
+    'students': ('full_name', 'email'),
+    'courses': ('name',),
+}
+
+
+def sqlite_fts(table, columns):
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id')")
+    op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END")
+    op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END")
+    op.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END")
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                op.create_index(f'ix_{table}_{column}_trgm', table, [column],
+                                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for table, columns in SEARCH_COLUMNS.items():
+            sqlite_fts(table, columns)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
+    elif dialect == 'sqlite':
+        for table in SEARCH_COLUMNS:
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER {table}_fts_{trigger}')
+            op.execute(f'DROP TABLE {table}_fts')
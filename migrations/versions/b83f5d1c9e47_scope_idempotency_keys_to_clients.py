@@ -0,0 +1,37 @@
+"""scope idempotency keys to the client that sent them
+
+The primary key becomes (client, key). Keys stored before this revision get
+an empty client, so they are no longer replayed; they expire as usual.
+
+Revision ID: b83f5d1c9e47
+Revises: a6d40c93b7e5
+Create Date: 2026-10-18 18:41:26.275018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83f5d1c9e47'
+down_revision = 'a6d40c93b7e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None, recreate='always') as batch_op:
+        batch_op.add_column(sa.Column('client', sa.String(length=100), nullable=False, server_default=''),
+                            insert_before='key')
+        batch_op.create_primary_key('pk_idempotency_keys', ['client', 'key'])
+
+
+def downgrade():
+    # Keys of different clients may now clash: keep one of each
+    op.execute(
+        "DELETE FROM idempotency_keys WHERE client <> "
+        "(SELECT MIN(other.client) FROM idempotency_keys other WHERE other.key = idempotency_keys.key)"
+    )
+    with op.batch_alter_table('idempotency_keys', schema=None, recreate='always') as batch_op:
+        batch_op.create_primary_key('pk_idempotency_keys', ['key'])
+        batch_op.drop_column('client')
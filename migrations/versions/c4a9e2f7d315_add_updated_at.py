@@ -0,0 +1,36 @@
+"""add updated_at to courses, students, student_course and scores
+
+Existing rows start with updated_at = created_at.
+
+Revision ID: c4a9e2f7d315
+Revises: 8d3e61a4c0b7
+Create Date: 2026-10-18 19:05:37.842610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e2f7d315'
+down_revision = '8d3e61a4c0b7'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('courses', 'students', 'student_course', 'scores')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(f'UPDATE {table} SET updated_at = created_at')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
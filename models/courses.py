@@ -1,24 +1,71 @@
 from ..utils import db
+from ..utils.cache import cache
+from ..utils.pagination import CursorPage, paginate, paginate_async
 from datetime import datetime, timezone
 
 class Course(db.Model):
     __tablename__ = 'courses'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(20))
+    name = db.Column(db.String(20), index=True)
     created_at = db.Column(db.DateTime() , nullable=False , default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime() , nullable=False , default=datetime.utcnow , onupdate=datetime.utcnow)
 
     def save(self):
         db.session.add(self)
         db.session.commit()
+        self.invalidate_cache(self.id)
 
     def delete(self):
+        id = self.id
         db.session.delete(self)
         db.session.commit()
+        self.invalidate_cache(id)
     
     def update(self):
         db.session.commit()
+        self.invalidate_cache(self.id)
+
+    def to_dict(self):
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Attach a cached course to the session without querying the database """
+        course = cls(**data)
+        db.make_transient_to_detached(course)
+        return db.session.merge(course, load=False)
+
+    @staticmethod
+    def invalidate_cache(id):
+        cache.delete(f'course:{id}')
+        cache.bump('courses')
+        # Student course lists embed course names
+        cache.bump('student_courses')
 
     @classmethod
     def get_by_id(cls, id):
-        return cls.query.get_or_404(id)
\ No newline at end of file
+        data = cache.get_or_set(f'course:{id}', lambda: cls.query.get_or_404(id).to_dict())
+        return cls.from_dict(data)
+
+    @classmethod
+    def get_page(cls, limit=None, after=None):
+        """ A page of the course catalog with plain dict items, cached until a course changes """
+        from ..models.queries import course_rows
+
+        def load_page():
+            page = paginate(course_rows(), cls.id, limit, after)
+            return CursorPage([row._asdict() for row in page.items], page.limit, page.next_cursor)
+
+        return cache.get_or_set(cache.versioned_key('courses', 'page', limit, after), load_page)
+
+    @classmethod
+    async def get_page_async(cls, session, limit=None, after=None):
+        """ get_page, loading a missing page with an AsyncSession """
+        from ..models.queries import course_rows
+
+        async def load_page():
+            page = await paginate_async(session, course_rows(), cls.id, limit, after)
+            return CursorPage([row._asdict() for row in page.items], page.limit, page.next_cursor)
+
+        return await cache.get_or_set_async(cache.versioned_key('courses', 'page', limit, after), load_page)
\ No newline at end of file
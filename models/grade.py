@@ -1,26 +1,114 @@
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from ..utils import db
+from ..models.transcript import Transcript
 from datetime import datetime, timezone
 
 
+# INSERT ... ON CONFLICT DO UPDATE of each supported database
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
 class Score(db.Model):
     __tablename__ = 'scores'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='uq_scores_student_id_course_id'),
+        db.Index('ix_scores_course_id', 'course_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
     grade = db.Column(db.String(5) , nullable=True )
     created_at = db.Column(db.DateTime() , nullable=False , default=datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime() , nullable=False , default=datetime.utcnow , onupdate=datetime.utcnow)
+    # Bumped by every update, so a writer can check nobody changed the score since it read it
+    version = db.Column(db.Integer, nullable=False, default=1)
 
+    __mapper_args__ = {'version_id_col': version}
 
 
     def save(self):
         db.session.add(self)
+        Transcript.record_grade(self.student_id, self.course_id, self.grade)
         db.session.commit()
 
     def delete(self):
+        student_id, course_id = self.student_id, self.course_id
         db.session.delete(self)
+        Transcript.record_grade(student_id, course_id, None)
         db.session.commit()
 
     @classmethod
     def get_by_id(cls, id):
-        return cls.query.get_or_404(id)
\ No newline at end of file
+        return cls.query.get_or_404(id)
+
+    @classmethod
+    def upsert_statement(cls, rows):
+        """
+        One INSERT ... ON CONFLICT (student_id, course_id) DO UPDATE statement that
+        grades every row of `rows` (dicts of student_id, course_id and grade) and
+        bumps the version of the scores that already exist.
+        """
+        dialect = db.session.get_bind(mapper=cls).dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise NotImplementedError(f'Score upserts are not supported on {dialect}')
+
+        now = datetime.utcnow()
+        statement = UPSERT_INSERTS[dialect](cls.__table__).values([
+            dict(row, created_at=now, updated_at=now, version=1) for row in rows
+        ])
+        return statement.on_conflict_do_update(
+            index_elements=['student_id', 'course_id'],
+            set_={
+                'grade': statement.excluded.grade,
+                'updated_at': statement.excluded.updated_at,
+                'version': cls.__table__.c.version + 1,
+            },
+        )
+
+    @classmethod
+    def expire_loaded(cls, pairs):
+        """
+        Expire the scores of the (student_id, course_id) `pairs` loaded in the session.
+        Upserts bump their version behind the ORM, whose next flush of a stale version
+        would raise StaleDataError.
+        """
+        for instance in list(db.session.identity_map.values()):
+            if not isinstance(instance, cls):
+                continue
+            # The loaded values only: an instance expired already has nothing stale to flush
+            loaded = inspect(instance).dict
+            if (loaded.get('student_id'), loaded.get('course_id')) in pairs:
+                db.session.expire(instance)
+
+    @classmethod
+    def upsert(cls, student_id, course_id, grade, version=None):
+        """
+        Atomically grade a student in a course, whether or not a score exists yet,
+        and record it on the transcript; the caller commits. Returns the new version
+        of the score (1 when it was created), or None when `version` was given and
+        the score is no longer at that version. A score that was deleted is not at
+        any version: with `version` only an existing score is updated.
+        """
+        if version is None:
+            statement = cls.upsert_statement([{'student_id': student_id, 'course_id': course_id, 'grade': grade}])
+        else:
+            statement = (
+                cls.__table__.update()
+                .where(cls.__table__.c.student_id == student_id, cls.__table__.c.course_id == course_id,
+                       cls.__table__.c.version == version)
+                .values(grade=grade, updated_at=datetime.utcnow(), version=cls.__table__.c.version + 1)
+            )
+        if db.session.execute(statement).rowcount == 0:
+            return None
+        cls.expire_loaded({(student_id, course_id)})
+        Transcript.record_grade(student_id, course_id, grade)
+        return (
+            db.session.query(cls.version)
+            .filter(cls.student_id == student_id, cls.course_id == course_id)
+            .scalar()
+        )
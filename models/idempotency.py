@@ -0,0 +1,32 @@
+from ..utils import db
+from datetime import datetime
+
+
+class IdempotencyKey(db.Model):
+    """
+    A client supplied Idempotency-Key and the response of the request that
+    first used it, replayed when the client retries the request with the same key.
+    """
+    __tablename__ = 'idempotency_keys'
+
+    # The client that sent the key (utils.ratelimit.client_key): the same key sent by
+    # two clients is two different keys
+    client = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # Both null while the first request is still running
+    status_code = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, index=True)
+
+
+    def __repr__(self):
+        return f"<Idempotency Key {self.client} {self.key}>"
+
+    @classmethod
+    def purge(cls, before):
+        """ Delete the keys used before `before` and commit """
+        deleted = db.session.query(cls).filter(cls.created_at < before).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
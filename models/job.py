@@ -0,0 +1,49 @@
+from ..utils import db
+from datetime import datetime
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    # Enqueued, but waiting for the rest of its batch before it can be claimed
+    HELD = 'held'
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    # Jobs enqueued together by one request, e.g. the chunks of a bulk grade upload
+    batch = db.Column(db.String(36), nullable=True, index=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    worker = db.Column(db.String(100), nullable=True)
+    run_after = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime(), nullable=True)
+    finished_at = db.Column(db.DateTime(), nullable=True)
+
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
+
+    @classmethod
+    def get_by_id(cls, id):
+        return cls.query.get_or_404(id)
+
+    @classmethod
+    def get_batch(cls, batch):
+        return cls.query.filter_by(batch=batch).order_by(cls.id).all()
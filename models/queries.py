@@ -0,0 +1,73 @@
+"""
+Read queries of the list and report endpoints.
+
+Projections select only the columns an endpoint returns and give Row tuples,
+which read like the entities (row.id, row.full_name) but skip building ORM
+objects and tracking them in the session's identity map. Given the ?fields=
+of a request, they select those columns only. Endpoints that do need entities
+pick which relationships to load up front from the loaders.
+"""
+from ..utils import db
+from ..models.students import Student
+from ..models.courses import Course
+from ..models.studentcourse import StudentCourse
+
+
+STUDENT_COLUMNS = (Student.id, Student.email, Student.full_name, Student.date_of_birth, Student.updated_at)
+COURSE_COLUMNS = tuple(Course.__table__.columns)
+# Always selected: keyset pagination and the ETag and Last-Modified validators use them
+KEY_COLUMNS = ('id', 'updated_at')
+
+# How each Student relationship is loaded up front: collections with one extra
+# SELECT ... IN each, so loading several does not multiply the rows fetched,
+# and the one-to-one transcript in the same query with a LEFT OUTER JOIN
+STUDENT_LOADERS = {
+    'courses': (db.selectinload, 'courses'),
+    'scores': (db.selectinload, 'score'),
+    'transcript': (db.joinedload, 'transcript'),
+}
+
+
+def load_student(student_id, *relationships):
+    """ A Student entity (404 when missing) with `relationships`, keys of STUDENT_LOADERS, loaded """
+    options = []
+    for name in relationships:
+        loader, attribute = STUDENT_LOADERS[name]
+        options.append(loader(getattr(Student, attribute)))
+    return Student.query.options(*options).get_or_404(student_id)
+
+
+def project(columns, fields=None):
+    """ The `columns` named in `fields` (all of them for None), and the key columns """
+    if fields is None:
+        return columns
+    return tuple(column for column in columns if column.key in fields or column.key in KEY_COLUMNS)
+
+
+def student_rows(fields=None):
+    return db.session.query(*project(STUDENT_COLUMNS, fields))
+
+
+def course_rows(fields=None):
+    return db.session.query(*project(COURSE_COLUMNS, fields))
+
+
+def course_student_rows(course_id):
+    """ (id, full_name, course_name) of the students enrolled in a course, by student ID """
+    return (
+        db.session.query(Student.id, Student.full_name, Course.name.label('course_name'))
+        .join(StudentCourse, StudentCourse.student_id == Student.id)
+        .join(Course, Course.id == StudentCourse.course_id)
+        .filter(StudentCourse.course_id == course_id)
+        .order_by(Student.id)
+    )
+
+
+def student_course_rows(student_id):
+    """ The courses a student is enrolled in, by course ID """
+    return (
+        course_rows()
+        .join(StudentCourse, StudentCourse.course_id == Course.id)
+        .filter(StudentCourse.student_id == student_id)
+        .order_by(Course.id)
+    )
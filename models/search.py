@@ -0,0 +1,155 @@
+"""
+Ranked search over student names and emails and course names.
+
+- Postgres: trigram (pg_trgm) GIN indexes serve substring matches and fuzzy
+  matches on similarity; results are ranked by similarity, prefix matches first.
+- SQLite: FTS5 tables kept in sync with the base tables by triggers serve
+  prefix matches on every word (and email part); results are ranked by bm25.
+- Other databases: unindexed case insensitive substring matches.
+
+The indexes, FTS tables and triggers are created along with the tables
+(db.create_all) and by the migrations.
+"""
+import re
+
+from sqlalchemy import event
+
+from ..utils import db
+from ..utils.pagination import offset_page, offset_page_async
+from ..models.students import Student
+from ..models.courses import Course
+from ..models.queries import student_rows, course_rows
+
+
+SEARCH_COLUMNS = {
+    Student.__table__: ('full_name', 'email'),
+    Course.__table__: ('name',),
+}
+
+
+def _fts_table(table):
+    return f'{table.name}_fts'
+
+
+def _postgres_ddl(table):
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        *[f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column}_trgm ON {table.name} '
+          f'USING gin ({column} gin_trgm_ops)' for column in SEARCH_COLUMNS[table]],
+    ]
+
+
+def _sqlite_ddl(table):
+    """ An external content FTS5 table over the search columns, and the triggers keeping it in sync """
+    fts = _fts_table(table)
+    columns = ', '.join(SEARCH_COLUMNS[table])
+    new = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS[table])
+    old = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS[table])
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content='{table.name}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table.name} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table.name} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table.name} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def search_ddl(table, dialect):
+    """ Statements creating the search indexes of `table` on `dialect` """
+    if dialect == 'postgresql':
+        return _postgres_ddl(table)
+    if dialect == 'sqlite':
+        return _sqlite_ddl(table)
+    return []
+
+
+def drop_search_ddl(table, dialect):
+    if dialect == 'postgresql':
+        return [f'DROP INDEX IF EXISTS ix_{table.name}_{column}_trgm' for column in SEARCH_COLUMNS[table]]
+    if dialect == 'sqlite':
+        # The triggers go with the base table
+        return [f'DROP TABLE IF EXISTS {_fts_table(table)}']
+    return []
+
+
+def _create_search_indexes(table, connection, **kwargs):
+    for statement in search_ddl(table, connection.dialect.name):
+        connection.execute(db.text(statement))
+
+
+def _drop_search_indexes(table, connection, **kwargs):
+    for statement in drop_search_ddl(table, connection.dialect.name):
+        connection.execute(db.text(statement))
+
+
+for searchable in SEARCH_COLUMNS:
+    event.listen(searchable, 'after_create', _create_search_indexes)
+    event.listen(searchable, 'after_drop', _drop_search_indexes)
+
+
+def _escape_like(term):
+    return re.sub(r'([\\%_])', r'\\\1', term)
+
+
+def fts_match(words):
+    """ Every word as a prefix; whole word matches also match the exact term, so they rank first """
+    return ' AND '.join(f'("{word}" OR "{word}"*)' for word in words)
+
+
+def _ranked(query, model, term, dialect=None):
+    table = model.__table__
+    columns = [getattr(model, column) for column in SEARCH_COLUMNS[table]]
+    if dialect is None:
+        dialect = db.session.get_bind(mapper=model).dialect.name
+    pattern = f'%{_escape_like(term)}%'
+    prefix = f'{_escape_like(term)}%'
+
+    if dialect == 'sqlite':
+        words = re.findall(r'\w+', term.lower())
+        if not words:
+            # Only punctuation, which the FTS tokenizer drops
+            return query.filter(db.false())
+        fts = db.table(_fts_table(table), db.column('rowid'))
+        return (
+            query.join(fts, fts.c.rowid == model.id)
+            .filter(db.text(f'{fts.name} MATCH :match').bindparams(match=fts_match(words)))
+            .order_by(db.text(f'bm25({fts.name})'), model.id)
+        )
+
+    matches = [column.ilike(pattern, escape='\\') for column in columns]
+    prefix_match = db.case((db.or_(*[column.ilike(prefix, escape='\\') for column in columns]), 1), else_=0)
+    if dialect == 'postgresql':
+        matches += [column.op('%')(term) for column in columns]
+        similarity = db.func.greatest(*[db.func.similarity(column, term) for column in columns])
+        return query.filter(db.or_(*matches)).order_by(prefix_match.desc(), similarity.desc(), model.id)
+    return query.filter(db.or_(*matches)).order_by(prefix_match.desc(), model.id)
+
+
+def student_search(term, fields=None, dialect=None):
+    """ The students whose name or email matches `term`, best matches first """
+    return _ranked(student_rows(fields), Student, term, dialect)
+
+
+def course_search(term, fields=None, dialect=None):
+    """ The courses whose name matches `term`, best matches first """
+    return _ranked(course_rows(fields), Course, term, dialect)
+
+
+def search_students(term, limit, offset=None, fields=None):
+    return offset_page(student_search(term, fields), limit, offset)
+
+
+def search_courses(term, limit, offset=None, fields=None):
+    return offset_page(course_search(term, fields), limit, offset)
+
+
+async def search_students_async(session, term, limit, offset=None, fields=None):
+    query = student_search(term, fields, session.bind.dialect.name)
+    return await offset_page_async(session, query, limit, offset)
+
+
+async def search_courses_async(session, term, limit, offset=None, fields=None):
+    query = course_search(term, fields, session.bind.dialect.name)
+    return await offset_page_async(session, query, limit, offset)
@@ -1,16 +1,57 @@
 from ..utils import db
+from ..utils.cache import cache
 from datetime import datetime, timezone
 from ..models.students import Student
 from ..models.courses import Course
+from ..models.grade import Score
+from ..models.transcript import Transcript
+from ..grade.grade_converter import convert_grade_to_gpa
+
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def grade_statistics(histogram):
+    """
+    Mean, median and percentile GPA of a {grade: count} histogram. Works on the
+    handful of distinct grades instead of one value per student.
+    """
+    points = sorted((convert_grade_to_gpa(grade), count) for grade, count in histogram.items())
+    graded = sum(count for _, count in points)
+    if not graded:
+        return {'graded': 0, 'mean_gpa': None, 'median_gpa': None,
+                'percentiles': {str(p): None for p in PERCENTILES}}
+
+    def percentile(p):
+        # Nearest rank: the smallest GPA with at least p% of the grades at or below it
+        rank = max(1, -(-p * graded // 100))
+        seen = 0
+        for gpa, count in points:
+            seen += count
+            if seen >= rank:
+                return gpa
+
+    mean = sum(gpa * count for gpa, count in points) / graded
+    return {
+        'graded': graded,
+        'mean_gpa': round(mean, 2),
+        'median_gpa': percentile(50),
+        'percentiles': {str(p): percentile(p) for p in PERCENTILES},
+    }
 
 
 class StudentCourse(db.Model):
     __tablename__ = 'student_course'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='uq_student_course_student_id_course_id'),
+        db.Index('ix_student_course_course_id', 'course_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'))
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'))
     created_at = db.Column(db.DateTime() , nullable=False , default=datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime() , nullable=False , default=datetime.utcnow , onupdate=datetime.utcnow)
 
 
     def __repr__(self):
@@ -19,13 +60,21 @@ class StudentCourse(db.Model):
     def save(self):
         db.session.add(self)
         db.session.commit()
+        self.invalidate_cache(self.student_id)
 
     def delete(self):
+        student_id = self.student_id
         db.session.delete(self)
         db.session.commit()
+        self.invalidate_cache(student_id)
     
     def update(self):
         db.session.commit()
+        self.invalidate_cache(self.student_id)
+
+    @staticmethod
+    def invalidate_cache(*student_ids):
+        cache.delete(*[cache.versioned_key('student_courses', student_id) for student_id in student_ids])
 
 
     @classmethod
@@ -35,14 +84,166 @@ class StudentCourse(db.Model):
 
     @classmethod
     def get_students_in_course_by(cls, course_id):
-        students = (Student.query.join(StudentCourse).join(Course).filter(Course.id == course_id).all()
-        )
-        return students
+        """ (id, full_name, course_name) rows of the students enrolled in a course """
+        from ..models.queries import course_student_rows
+
+        return course_student_rows(course_id).all()
     
 
     @classmethod
     def get_student_courses(cls, student_id):
-        courses = (
-            Course.query.join(StudentCourse).join(Student).filter(Student.id == student_id).all()
+        """ The courses of a student as plain dicts, cached until an enrollment or course changes """
+        from ..models.queries import student_course_rows
+
+        def load_courses():
+            return [row._asdict() for row in student_course_rows(student_id)]
+
+        return cache.get_or_set(cache.versioned_key('student_courses', student_id), load_courses)
+
+
+    @classmethod
+    def get_student_course_grades(cls, student_id):
+        """
+        Courses a student is enrolled in with their grade (None if not graded yet),
+        in a single query: student_course JOIN courses LEFT JOIN scores
+        """
+        grades = (
+            db.session.query(Course.id, Course.name, Score.grade)
+            .join(cls, cls.course_id == Course.id)
+            .outerjoin(Score, db.and_(Score.student_id == cls.student_id, Score.course_id == cls.course_id))
+            .filter(cls.student_id == student_id)
+            .order_by(Course.id)
+            .all()
         )
-        return courses
\ No newline at end of file
+        return grades
+
+
+    @classmethod
+    def bulk_enroll(cls, pairs):
+        """
+        Enroll many (student_id, course_id) pairs in one transaction.
+        Returns a status for every pair, in order: 'enrolled', 'already_enrolled',
+        'duplicate' (repeated in the same batch), 'student_not_found' or 'course_not_found'.
+        """
+        student_ids = {student_id for student_id, _ in pairs}
+        course_ids = {course_id for _, course_id in pairs}
+
+        existing_students = {
+            row.id for row in db.session.query(Student.id).filter(Student.id.in_(student_ids))
+        }
+        existing_courses = {
+            row.id for row in db.session.query(Course.id).filter(Course.id.in_(course_ids))
+        }
+        enrolled = {
+            (row.student_id, row.course_id) for row in
+            db.session.query(cls.student_id, cls.course_id)
+            .filter(cls.student_id.in_(student_ids), cls.course_id.in_(course_ids))
+        }
+
+        statuses = []
+        new_rows = []
+        batch = set()
+        for student_id, course_id in pairs:
+            if student_id not in existing_students:
+                statuses.append('student_not_found')
+            elif course_id not in existing_courses:
+                statuses.append('course_not_found')
+            elif (student_id, course_id) in batch:
+                statuses.append('duplicate')
+            elif (student_id, course_id) in enrolled:
+                statuses.append('already_enrolled')
+            else:
+                statuses.append('enrolled')
+                batch.add((student_id, course_id))
+                new_rows.append({
+                    'student_id': student_id,
+                    'course_id': course_id,
+                    'created_at': datetime.now(timezone.utc),
+                })
+
+        if new_rows:
+            db.session.execute(cls.__table__.insert().values(new_rows))
+        db.session.commit()
+        cls.invalidate_cache(*{row['student_id'] for row in new_rows})
+        return statuses
+
+
+    @classmethod
+    def bulk_grade(cls, grades):
+        """
+        Insert or update the scores of many (student_id, course_id, grade) rows with one
+        INSERT ... ON CONFLICT statement and commit. The last grade wins when a pair repeats.
+        Returns (inserted, updated, not_enrolled) where not_enrolled lists the positions in
+        `grades` of pairs without an enrollment.
+        """
+        student_ids = {student_id for student_id, _, _ in grades}
+        course_ids = {course_id for _, course_id, _ in grades}
+
+        enrolled = {
+            (row.student_id, row.course_id) for row in
+            db.session.query(cls.student_id, cls.course_id)
+            .filter(cls.student_id.in_(student_ids), cls.course_id.in_(course_ids))
+        }
+
+        latest = {}
+        not_enrolled = []
+        for position, (student_id, course_id, grade) in enumerate(grades):
+            if (student_id, course_id) in enrolled:
+                latest[(student_id, course_id)] = grade
+            else:
+                not_enrolled.append(position)
+
+        if not latest:
+            return 0, 0, not_enrolled
+
+        # Only used to report counts: the upsert itself does not depend on it
+        updated = (
+            db.session.query(db.func.count(Score.id))
+            .filter(Score.student_id.in_(student_ids), Score.course_id.in_(course_ids))
+            .filter(db.tuple_(Score.student_id, Score.course_id).in_(list(latest)))
+            .scalar()
+        )
+        db.session.execute(Score.upsert_statement([
+            {'student_id': student_id, 'course_id': course_id, 'grade': grade}
+            for (student_id, course_id), grade in latest.items()
+        ]))
+        Score.expire_loaded(latest)
+        Transcript.refresh({student_id for student_id, _ in latest}, commit=False)
+        db.session.commit()
+        return len(latest) - updated, updated, not_enrolled
+
+
+    @classmethod
+    def get_course_statistics(cls, course_ids=None):
+        """
+        Enrollment count and grade statistics of the given courses (all courses when None),
+        from two GROUP BY queries over student_course and scores. The enrollment counts are
+        outer joined to the courses, so a course without enrollments is reported with zeros.
+        """
+        enrolled = (
+            db.session.query(cls.course_id, db.func.count(cls.id).label('enrolled'))
+            .group_by(cls.course_id)
+            .subquery()
+        )
+        enrollments = (
+            db.session.query(Course.id, db.func.coalesce(enrolled.c.enrolled, 0))
+            .outerjoin(enrolled, enrolled.c.course_id == Course.id)
+        )
+        grades = (
+            db.session.query(Course.id, Score.grade, db.func.count(Score.id))
+            .join(Score, db.and_(Score.course_id == Course.id, Score.grade.isnot(None)))
+            .group_by(Course.id, Score.grade)
+        )
+        if course_ids is not None:
+            enrollments = enrollments.filter(Course.id.in_(course_ids))
+            grades = grades.filter(Course.id.in_(course_ids))
+
+        statistics = {course_id: {'enrolled': enrolled, 'histogram': {}} for course_id, enrolled in enrollments}
+        for course_id, grade, count in grades:
+            statistics[course_id]['histogram'][grade] = count
+
+        for course_id, course_statistics in statistics.items():
+            course_statistics['course_id'] = course_id
+            course_statistics.update(grade_statistics(course_statistics['histogram']))
+        return statistics
+
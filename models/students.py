@@ -1,6 +1,12 @@
 from ..utils import db
+from ..utils.cache import cache
 from datetime import datetime, timezone
 
+
+# Key of the Postgres advisory lock serializing the allocation of student IDs
+ID_ALLOCATION_LOCK = 7401
+
+
 class Student(db.Model):
     __tablename__ = 'students'
 
@@ -9,21 +15,30 @@ class Student(db.Model):
     full_name = db.Column(db.String(50), nullable=False )
     date_of_birth =  db.Column(db.String(50), nullable=False )
     created_at = db.Column(db.DateTime() , nullable=False , default=datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime() , nullable=False , default=datetime.utcnow , onupdate=datetime.utcnow)
     full_name = db.Column(db.String(10), nullable=False )
     courses = db.relationship('Course', secondary='student_course')
-    score = db.relationship('Score', backref='student_score', lazy=True)
+    score = db.relationship('Score', backref='student_score', lazy=True, cascade='all, delete-orphan')
 
 
     def save(self):
         db.session.add(self)
         db.session.commit()
+        self.invalidate_cache(self.id)
 
     def delete(self):
+        id = self.id
         db.session.delete(self)
         db.session.commit()
+        self.invalidate_cache(id)
 
     def update(self):
         db.session.commit()
+        self.invalidate_cache(self.id)
+
+    @staticmethod
+    def invalidate_cache(id):
+        cache.delete(cache.versioned_key('student_courses', id))
 
 
     @classmethod
@@ -35,5 +50,103 @@ class Student(db.Model):
     def get_by_email(cls, email):
         return cls.query.filter_by(email=email).first()
 
+    @classmethod
+    def lock_id_allocation(cls):
+        """
+        Hold off the registrations of other transactions until this one ends, so two
+        registrations never number their students from the same max(id)
+        """
+        dialect = db.session.get_bind(mapper=cls).dialect.name
+        if dialect == 'postgresql':
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': ID_ALLOCATION_LOCK})
+        elif dialect == 'sqlite':
+            # One writer at a time: take the write lock now instead of at the INSERT
+            db.session.execute(cls.__table__.update().where(db.false()).values(id=cls.__table__.c.id))
+        else:
+            db.session.query(cls.id).order_by(cls.id.desc()).limit(1).with_for_update().all()
+
+    @classmethod
+    def allocate_ids(cls, count):
+        """
+        `count` IDs for new students, taken under lock_id_allocation. Students share
+        their IDs with users when that table is mapped: they come from its sequence
+        on Postgres and follow max(users.id) elsewhere, so a teacher's ID is never
+        reused. Without users they follow max(students.id).
+        """
+        users = db.metadata.tables.get('users')
+        if users is None:
+            tables = [cls.__table__]
+        elif db.session.get_bind(mapper=cls).dialect.name == 'postgresql':
+            return list(db.session.execute(
+                db.text("SELECT nextval(pg_get_serial_sequence('users', 'id')) FROM generate_series(1, :count)"),
+                {'count': count},
+            ).scalars())
+        else:
+            tables = [cls.__table__, users]
+        next_id = max(db.session.query(db.func.max(table.c.id)).scalar() or 0 for table in tables) + 1
+        return list(range(next_id, next_id + count))
+
+    @classmethod
+    def user_rows(cls, rows):
+        """
+        The rows of the users table for new students, from their students rows:
+        each gets the values of the columns both tables have and, when users is
+        mapped polymorphically, the 'student' identity. Raises NotImplementedError
+        for a required users column neither provides.
+        """
+        users = db.metadata.tables['users']
+        values = {}
+        mapper = next((mapper for mapper in db.Model.registry.mappers if mapper.local_table is users), None)
+        if mapper is not None and mapper.polymorphic_on is not None:
+            values[mapper.polymorphic_on.name] = 'student'
+        shared = [column.name for column in users.columns if column.name in cls.__table__.c]
+        missing = [
+            column.name for column in users.columns
+            if not (column.nullable or column.default is not None or column.server_default is not None
+                    or column.name in shared or column.name in values)
+        ]
+        if missing:
+            raise NotImplementedError(f"Students cannot fill the users columns {', '.join(missing)}")
+        for row in rows:
+            yield dict(values, **{name: row[name] for name in shared if name in row})
+
+    @classmethod
+    def bulk_register(cls, rows):
+        """
+        Register many students (dicts of email, full_name and date_of_birth) in one
+        transaction, with a single query for the emails already registered.
+        Returns a (status, id) for every row, in order: ('registered', new id),
+        ('email_exists', id of the registered student) or ('duplicate', None)
+        for an email repeated in the same batch. New IDs come from allocate_ids.
+        """
+        cls.lock_id_allocation()
+        emails = {row['email'] for row in rows}
+        existing = dict(db.session.query(cls.email, cls.id).filter(cls.email.in_(emails))) if emails else {}
+
+        results = []
+        new_rows = []
+        batch = set()
+        # One new student per email not registered yet
+        ids = iter(cls.allocate_ids(len(emails - existing.keys())))
+        now = datetime.now(timezone.utc)
+        for row in rows:
+            if row['email'] in existing:
+                results.append(('email_exists', existing[row['email']]))
+            elif row['email'] in batch:
+                results.append(('duplicate', None))
+            else:
+                batch.add(row['email'])
+                new_rows.append(dict(row, id=next(ids), created_at=now, updated_at=now))
+                results.append(('registered', new_rows[-1]['id']))
+
+        if new_rows:
+            # Students reference users.id: when a users table is mapped, its rows come first
+            users = db.metadata.tables.get('users')
+            if users is not None:
+                db.session.execute(users.insert(), list(cls.user_rows(new_rows)))
+            db.session.execute(cls.__table__.insert(), new_rows)
+        db.session.commit()
+        return results
+
     def __repr__(self) -> str:
         return self.email
\ No newline at end of file
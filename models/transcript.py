@@ -0,0 +1,99 @@
+from ..utils import db
+from ..utils.routing import routing
+from ..models.students import Student
+from ..grade.grade_converter import convert_grade_to_gpa
+from datetime import datetime
+
+
+class Transcript(db.Model):
+    """
+    Per student aggregate of the `scores` table, kept up to date by every
+    score write so a transcript is read with a single row lookup.
+    Courses have no credit hours, so every graded course counts as one credit.
+    """
+    __tablename__ = 'transcripts'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    credits = db.Column(db.Integer, nullable=False, default=0)
+    grade_points = db.Column(db.Float, nullable=False, default=0.0)
+    gpa = db.Column(db.Float, nullable=True)
+    # {course_id: {'grade': ..., 'points': ...}} with string keys, as stored in JSON
+    grades = db.Column(db.JSON, nullable=False, default=dict)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Deleted along with the student
+    student = db.relationship(Student, backref=db.backref('transcript', uselist=False, cascade='all, delete-orphan'))
+
+
+    def __repr__(self):
+        return f"<Transcript {self.student_id}>"
+
+    def set_grades(self, grades):
+        self.grades = grades
+        self.credits = len(grades)
+        self.grade_points = sum(course['points'] for course in grades.values())
+        self.gpa = round(self.grade_points / self.credits, 2) if self.credits else None
+
+    @staticmethod
+    def course_grade(grade):
+        return {'grade': grade, 'points': convert_grade_to_gpa(grade)}
+
+    @classmethod
+    def get_by_student(cls, student_id):
+        transcript = db.session.get(cls, student_id)
+        if transcript is None:
+            # Built on first read for students graded before transcripts existed, and then
+            # read back, from the primary: a replica may not have the latest scores yet
+            with routing.primary():
+                Student.get_by_id(student_id)
+                cls.refresh([student_id])
+                transcript = db.session.get(cls, student_id)
+        return transcript
+
+    @classmethod
+    def record_grade(cls, student_id, course_id, grade):
+        """
+        Apply one score change (grade None for a deleted score) to the student's
+        transcript in the current transaction; the caller commits.
+        """
+        transcript = db.session.query(cls).filter_by(student_id=student_id).with_for_update().first()
+        if transcript is None:
+            # First transcript write for this student: build it from the scores already flushed
+            db.session.flush()
+            cls.refresh([student_id], commit=False)
+            return
+
+        grades = dict(transcript.grades)
+        if grade is None:
+            grades.pop(str(course_id), None)
+        else:
+            grades[str(course_id)] = cls.course_grade(grade)
+        transcript.set_grades(grades)
+
+    @classmethod
+    def refresh(cls, student_ids, commit=True):
+        """ Rebuild the transcripts of `student_ids` from their scores (on the primary) with one query """
+        from ..models.grade import Score
+
+        student_ids = set(student_ids)
+        grades = {student_id: {} for student_id in student_ids}
+        with routing.primary():
+            rows = (
+                db.session.query(Score.student_id, Score.course_id, Score.grade)
+                .filter(Score.student_id.in_(student_ids), Score.grade.isnot(None))
+                .all()
+            )
+        for row in rows:
+            grades[row.student_id][str(row.course_id)] = cls.course_grade(row.grade)
+
+        transcripts = {
+            transcript.student_id: transcript for transcript in
+            db.session.query(cls).filter(cls.student_id.in_(student_ids)).with_for_update()
+        }
+        for student_id in student_ids:
+            transcript = transcripts.get(student_id)
+            if transcript is None:
+                transcript = cls(student_id=student_id)
+                db.session.add(transcript)
+            transcript.set_grades(grades[student_id])
+        if commit:
+            db.session.commit()
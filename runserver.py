@@ -1,7 +1,52 @@
+import multiprocessing
+
 from api import create_app
-from api.config.config import config_dict
+from api.config.config import config_dict, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_MAX_CONNECTIONS
+from api.utils import db
+from api.utils.startup import namespaces
+import decouple
 
 app = create_app(config=config_dict['prod'])
+namespaces.load(app)
+
+# Gunicorn preset, used with:
+#
+#     gunicorn -c python:api.runserver api.runserver:app
+#
+# Every worker process has its own connection pool of DB_POOL_SIZE
+# connections plus up to DB_MAX_OVERFLOW more under bursts. Each thread holds
+# at most one connection at a time, so a worker runs DB_POOL_SIZE threads and
+# the number of workers is capped so that the pools of all workers together
+# stay within DB_MAX_CONNECTIONS:
+#
+#     workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) <= DB_MAX_CONNECTIONS
+#
+# With the defaults (5 + 5 connections, 90 available) that is at most 9
+# workers of 5 threads. Any of these can be overridden with GUNICORN_* variables.
+# (decouple is imported as a module: gunicorn reads every global of this module
+# as a setting, and `config` is one.)
+bind = decouple.config('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+threads = decouple.config('GUNICORN_THREADS', DB_POOL_SIZE, cast=int)
+workers = decouple.config(
+    'GUNICORN_WORKERS',
+    max(1, min(multiprocessing.cpu_count() * 2 + 1, DB_MAX_CONNECTIONS // (DB_POOL_SIZE + DB_MAX_OVERFLOW))),
+    cast=int
+)
+timeout = decouple.config('GUNICORN_TIMEOUT', 30, cast=int)
+# Recycle workers now and then so each one starts again with a fresh pool
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', 1000, cast=int)
+max_requests_jitter = decouple.config('GUNICORN_MAX_REQUESTS_JITTER', 100, cast=int)
+# The app is created and its modules imported once, in the master: workers,
+# including the ones started by autoscaling or max_requests, fork ready to serve
+preload_app = decouple.config('GUNICORN_PRELOAD_APP', True, cast=bool)
+
+
+def post_fork(server, worker):
+    # Connections the master may have opened belong to it; the worker opens its own
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()
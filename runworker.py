@@ -0,0 +1,23 @@
+import signal
+
+from api import create_app
+from api.config.config import config_dict
+from api.jobs.queue import Worker
+
+app = create_app(config=config_dict['prod'])
+
+# Background job worker, used with:
+#
+#     python -m api.runworker
+#
+# Jobs (course deletions, bulk grade uploads) are queued in the jobs table by
+# the web workers and run here one at a time. Start several processes to run
+# jobs in parallel; each claims its own jobs. On SIGTERM or SIGINT a worker
+# finishes its current job before exiting.
+
+if __name__ == "__main__":
+    worker = Worker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    with app.app_context():
+        worker.work()
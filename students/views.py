@@ -1,17 +1,29 @@
 import datetime
 
-from flask_restx import Namespace, Resource, fields
+from flask_restx import Namespace, Resource, fields, marshal
 from ..utils import db
-from flask import request
+from flask import request, current_app
 from ..models.students import Student
 from ..models.studentcourse import StudentCourse
 from ..models.courses import Course
 from ..models.grade import Score
+from ..models.transcript import Transcript
+from ..models.queries import student_rows, load_student
+from ..models.search import search_students, search_students_async
 from http import HTTPStatus
 from ..decorators.decorator import  teacher_required
 from ..grade.grade_converter import get_grade, convert_grade_to_gpa
-from dateutil.relativedelta import relativedelta
+from ..utils.pagination import paginate, paginate_async, pagination_parser, search_parser, get_search_args
+from ..utils.async_db import async_db
+from ..utils.ratelimit import limiter
+from ..utils.conditional import get_validators, not_modified, conditional_headers
+from ..utils.serializer import serialize_with, compile_model, requested_fields, FIELDS_PARAM
+from ..utils.idempotency import idempotent, IDEMPOTENCY_PARAM
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from ..jobs.queue import enqueue, release_batch, cancel_batch
+from ..utils.ingest import iter_records, chunked, IngestError, CSV_MIMETYPES, JSON_LINES_MIMETYPES
 import re
+import uuid
 
 students_namespace = Namespace('students', description='Namespace for Student ')
 
@@ -40,7 +52,8 @@ students_update_model =students_namespace.model( 'update student' ,{
 student_score_add_fields_model = {
     'student_id': fields.Integer(required=False, description='ID of student'),
     'course_id': fields.Integer(required=True, description='ID of course'),
-    'score': fields.Integer(required=True, description="Score value"),
+    'grade': fields.String(required=True, description="Grade"),
+    'version': fields.Integer(required=False, description="Version of the score the grade replaces"),
 }
 
 
@@ -73,6 +86,88 @@ courses_add_model = students_namespace.model('Courses ', course_fields_model)
 student_score_add_model = students_namespace.model('Courses add scores', student_score_add_fields_model)
 student_update_model = students_namespace.model('Students update ', student_score_update_model)
 
+transcript_course_model = students_namespace.model('Transcript course', {
+    'course_id': fields.Integer(description="Course's ID"),
+    'grade': fields.String(description="Grade in the course"),
+    'points': fields.Float(description="Grade points of the grade"),
+})
+
+transcript_model = students_namespace.model('Transcript', {
+    'student_id': fields.Integer(description="Student's ID"),
+    'gpa': fields.Float(description="Cumulative GPA, null until a course is graded"),
+    'credits': fields.Integer(description="Number of graded courses"),
+    'courses': fields.List(fields.Nested(transcript_course_model)),
+})
+
+bulk_score_accepted_model = students_namespace.model('Bulk score accepted', {
+    'batch': fields.String(description="Batch ID to poll at /jobs/batches/<batch>"),
+    'jobs': fields.Integer(description="Number of queued jobs, one per chunk of the upload"),
+})
+
+
+registration_batch_model = students_namespace.model('Signup batch', {
+    'students': fields.List(fields.Nested(student_signup_model), required=True,
+                            description="Students to register"),
+})
+
+registration_result_model = students_namespace.model('Signup result', {
+    'record': fields.Integer(description="Position of the record in the batch, from 0"),
+    'email': fields.String(description="Email of the record"),
+    'status': fields.String(description="registered, invalid, email_exists or duplicate"),
+    'id': fields.Integer(description="ID of the registered student"),
+    'message': fields.String(description="Why an invalid record was rejected"),
+})
+
+EMAIL_PATTERN = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,7}')
+MIN_STUDENT_AGE = 10
+
+
+def parse_registration(record):
+    """ Validate the fields of a registration record, returning (row, error); the age is checked by validate_registrations """
+    if not isinstance(record, dict):
+        return None, 'A registration must be an object'
+    row = {}
+    for name in ('email', 'full_name', 'date_of_birth'):
+        value = record.get(name)
+        if not isinstance(value, str) or not value.strip():
+            return None, f"'{name}' is required"
+        row[name] = value.strip()
+        length = Student.__table__.c[name].type.length
+        if len(row[name]) > length:
+            return None, f"'{name}' must be at most {length} characters"
+
+    if not EMAIL_PATTERN.fullmatch(row['email']):
+        return None, f"Invalid email '{row['email']}' Please check."
+    date_of_birth = row['date_of_birth']
+    try:
+        datetime.datetime.strptime(date_of_birth, '%Y%m%d')
+    except ValueError:
+        return None, f"Invalid date of birth '{date_of_birth}', expected YYYYMMDD."
+    return row, None
+
+
+def validate_registrations(records, today=None):
+    """
+    Validate registration records in one pass, returning the rows of the valid
+    ones and {index: error} for the others. Ages are whole years, from the
+    difference of the YYYYMMDD dates read as integers.
+    """
+    rows, errors = {}, {}
+    for index, record in enumerate(records):
+        row, error = parse_registration(record)
+        if error:
+            errors[index] = error
+        else:
+            rows[index] = row
+
+    today = int((today or datetime.date.today()).strftime('%Y%m%d'))
+    ages = {index: (today - int(row['date_of_birth'])) // 10000 for index, row in rows.items()}
+    for index, age in ages.items():
+        if age < MIN_STUDENT_AGE:
+            del rows[index]
+            errors[index] = f"Student is {age} years old, at least {MIN_STUDENT_AGE} are required."
+    return rows, errors
+
 
 @students_namespace.route('/register/student')
 class StudentRegistrationView(Resource):
@@ -83,78 +178,174 @@ class StudentRegistrationView(Resource):
             This endpoint is used for creation of a student
             """
     )
+    @limiter.limit('students')
     def post(self):
         """ Create a new Student"""
-        data = request.get_json()
-
-        # Check email address is valid or not
-        email = data.get('email')
-        pat = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
-        if not re.match(pat,email):
-            abort(HTTPStatus.CONFLICT, f"Invalid email '{email}' Please check.")
-        # Check if email already exists
-        if Student.get_by_email(email):
-            abort(HTTPStatus.CONFLICT, f"Student with email '{email}' already exists.")
-        # Create new Student
-        identifier = str(random.randint(1000, 9999))
-        date_of_birth_string = data.get("date_of_birth")
-        date_of_birth = datetime.datetime(date_of_birth_string,'%Y%m%d')
-        now = datetime.datetime.now()
-
-        difference = relativedelta(now, date_of_birth).years
-        if difference < 10:
-            abort(HTTPStatus.CONFLICT, f"Student has  '{difference}' year of birthday require 10 years.")
-        new_student = Student(
-            email=data.get('email'),
-            identifier=identifier,
-            first_name=data.get('first_name'),
-            last_name=data.get('last_name'),
-            date_of_birth = date_of_birth_string
-        )
+        rows, errors = validate_registrations([request.get_json()])
+        if errors:
+            return {'message': errors[0]}, HTTPStatus.CONFLICT
 
         try:
-            new_student.save()
-        except:
+            [(status, id)] = Student.bulk_register([rows[0]])
+        except IntegrityError:
             db.session.rollback()
             return {'message': 'An error occurred while saving student'}, HTTPStatus.INTERNAL_SERVER_ERROR
+        if status != 'registered':
+            return {'message': f"Student with email '{rows[0]['email']}' already exists."}, HTTPStatus.CONFLICT
+        return {
+            'message': 'You have been registered successfully as a ', 'id': id}, HTTPStatus.CREATED
+
+
+@students_namespace.route('/register/batch')
+class StudentBatchRegistrationView(Resource):
+
+    @students_namespace.expect(registration_batch_model)
+    @students_namespace.doc(
+        description="""
+            Register a whole intake of students in one request. Every record is
+            validated and the valid ones are inserted in a single transaction; the
+            report has a status for each record, in order: registered (with its
+            ID), invalid (with a message), email_exists or duplicate.
+            """
+    )
+    @limiter.limit('bulk')
+    @teacher_required()
+    def post(self):
+        """ Register Students in bulk """
+        data = request.get_json(silent=True)
+        records = data.get('students') if isinstance(data, dict) else None
+        if not isinstance(records, list):
+            return {'message': "'students' must be a list of registrations"}, HTTPStatus.BAD_REQUEST
+
+        max_records = current_app.config.get('BULK_REGISTRATION_MAX_RECORDS', 5000)
+        if len(records) > max_records:
+            return {"message": f"At most {max_records} students are allowed per request"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+        rows, errors = validate_registrations(records)
+        try:
+            statuses = dict(zip(rows, Student.bulk_register(list(rows.values()))))
+        except IntegrityError:
+            db.session.rollback()
+            return {"message": "Students changed concurrently, please retry"}, HTTPStatus.CONFLICT
+
+        results = []
+        for index, record in enumerate(records):
+            result = {'record': index, 'email': record.get('email') if isinstance(record, dict) else None}
+            if index in errors:
+                result.update(status='invalid', message=errors[index])
+            else:
+                status, id = statuses[index]
+                result.update(status=status, id=id if status == 'registered' else None)
+            results.append(result)
         return {
-            'message': 'You have been registered successfully as a '}, HTTPStatus.CREATED
+            "registered": sum(1 for status, _ in statuses.values() if status == 'registered'),
+            "results": compile_model(registration_result_model)(results)
+        }, HTTPStatus.OK
 
 
 @students_namespace.route('')
 class StudentsListView(Resource):
 
-    @students_namespace.marshal_with(students_model)
+    @students_namespace.expect(pagination_parser)
+    @serialize_with(students_namespace, students_model, as_list=True)
     @students_namespace.doc(
         description=""" 
-            Get All students list
+            Get All students list, one page at a time ordered by ID.
+            Pass the X-Next-Cursor response header as `after` to get the next page.
+            Answers 304 when If-None-Match matches the page.
             """
     )
     def get(self):
         """
         Get all Students
         """
-        students = Student.query.all()
-        return students , HTTPStatus.OK
+        page = paginate(student_rows(requested_fields(students_model)), Student.id)
+        return self.page_response(page)
+
+    @serialize_with(students_namespace, students_model, as_list=True)
+    async def async_get(self):
+        """ get, in the ASGI mode (utils/asgi.py) """
+        async with async_db.session() as session:
+            page = await paginate_async(session, student_rows(requested_fields(students_model)), Student.id)
+        return self.page_response(page)
+
+    @staticmethod
+    def page_response(page):
+        # ETag only: a deleted row changes the page without moving its latest updated_at
+        etag, _ = get_validators(page.items, page.next_cursor)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        headers = dict(page.headers(), **conditional_headers(etag))
+        return page.items, HTTPStatus.OK, headers
     
 
+@students_namespace.route('/search')
+class StudentsSearchView(Resource):
+
+    @students_namespace.expect(search_parser)
+    @serialize_with(students_namespace, students_model, as_list=True)
+    @students_namespace.doc(
+        description="""
+            Search students by name or email: each word of `q` matches the start of a
+            word of the name or email (Postgres also matches misspellings), best matches first.
+            Pass the X-Next-Cursor response header as `after` to get the next page.
+            """
+    )
+    def get(self):
+        """
+        Search Students
+        """
+        term, limit, offset = get_search_args()
+        page = search_students(term, limit, offset, requested_fields(students_model))
+        return page.items, HTTPStatus.OK, page.headers()
+
+    @serialize_with(students_namespace, students_model, as_list=True)
+    async def async_get(self):
+        """ get, in the ASGI mode (utils/asgi.py) """
+        term, limit, offset = get_search_args()
+        async with async_db.session() as session:
+            page = await search_students_async(session, term, limit, offset, requested_fields(students_model))
+        return page.items, HTTPStatus.OK, page.headers()
+
+
 @students_namespace.route('/<int:student_id>')
 class StudentRetrieveDeleteUpdateView(Resource):
 
-    @students_namespace.marshal_with(students_model)
+    @students_namespace.response(HTTPStatus.OK, 'Success', students_model)
+    @students_namespace.param(FIELDS_PARAM, 'Comma separated fields to return', _in='query')
     @students_namespace.doc(
         description="""
-            Get Student by ID
+            Get Student by ID.
+            Answers 304 when If-None-Match or If-Modified-Since match the student.
             """
     )
     def get(self, student_id):
         """
         Retrieve a Student by its ID
         """
-        student = Student.query.filter_by(id=student_id).first()
+        fields = requested_fields(students_model)
+        student = student_rows(fields).filter(Student.id == student_id).first()
+        return self.student_response(student, fields)
+
+    async def async_get(self, student_id):
+        """ get, in the ASGI mode (utils/asgi.py) """
+        fields = requested_fields(students_model)
+        async with async_db.session() as session:
+            result = await session.execute(student_rows(fields).filter(Student.id == student_id).statement)
+        return self.student_response(result.first(), fields)
+
+    @staticmethod
+    def student_response(student, fields):
         if not student:
             return {'message':'Student does not exist'}, HTTPStatus.NOT_FOUND
-        return student , HTTPStatus.OK
+
+        etag, last_modified = get_validators([student])
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
+        return compile_model(students_model, fields)(student), HTTPStatus.OK, conditional_headers(etag, last_modified)
     
     @students_namespace.expect(students_update_model)
     @students_namespace.marshal_with(students_model)
@@ -188,7 +379,8 @@ class StudentRetrieveDeleteUpdateView(Resource):
         """
             Delete a Student by its ID!
         """
-        student = Student.get_by_id(student_id)
+        # Deleting a student also deletes its enrollments, scores and transcript
+        student = load_student(student_id, 'courses', 'scores', 'transcript')
 
         student.delete()
 
@@ -203,21 +395,44 @@ class StudentCoursesGradeListView(Resource):
         """
         Retrieve a Student Grade for all courses
         """     
-        courses = StudentCourse.get_student_courses(student_id)
+        grades = StudentCourse.get_student_course_grades(student_id)
         response = []
-        
-        for course in courses:
+
+        for grade in grades:
             grade_response = {}
-            score_in_course = Score.query.filter_by(student_id=student_id , course_id=course.id).first()
-            grade_response['name'] = course.name
-            if score_in_course:
-                grade_response['grade'] = score_in_course.grade
-            else:
-                grade_response['grade'] = None
+            grade_response['name'] = grade.name
+            grade_response['grade'] = grade.grade
             response.append(grade_response)
         return response , HTTPStatus.OK
     
 
+@students_namespace.route('/<int:student_id>/transcript')
+class StudentTranscriptView(Resource):
+
+    @students_namespace.doc(
+        description="""
+            Get a Student's cumulative GPA, credits and grade in every graded course
+            """
+    )
+    @students_namespace.response(HTTPStatus.OK, 'Success', transcript_model)
+    def get(self, student_id):
+        """
+        Retrieve a Student's Transcript
+        """
+        transcript = Transcript.get_by_student(student_id)
+
+        resp = {
+            'student_id': transcript.student_id,
+            'gpa': transcript.gpa,
+            'credits': transcript.credits,
+            'courses': [
+                dict(course_id=int(course_id), **course)
+                for course_id, course in sorted(transcript.grades.items(), key=lambda item: int(item[0]))
+            ],
+        }
+        return marshal(resp, transcript_model), HTTPStatus.OK
+
+
 @students_namespace.route('/<int:student_id>/courses')
 class StudentCoursesListView(Resource):
 
@@ -231,8 +446,8 @@ class StudentCoursesListView(Resource):
 
         for course in courses:
                 course_resp = {}
-                course_resp['id'] = course.id
-                course_resp['name'] = course.name
+                course_resp['id'] = course['id']
+                course_resp['name'] = course['name']
 
                 resp.append(course_resp)
 
@@ -245,9 +460,17 @@ class StudentCourseScoreAddView(Resource):
     @students_namespace.expect(student_score_add_model)
     @students_namespace.doc(
         description=  """
-        Add student score to a course.
-        """
+        Add or update a student's score in a course, atomically. Pass the `version`
+        returned by an earlier write to only update the score if nobody changed it
+        since (409 otherwise). Retries with the same Idempotency-Key replay the
+        first response.
+        """,
+        params = {
+            'Idempotency-Key': IDEMPOTENCY_PARAM
+        }
     )
+    @idempotent
+    @limiter.limit('students')
     def put(self):
         """
         Grade Student Course!
@@ -255,6 +478,7 @@ class StudentCourseScoreAddView(Resource):
         student_id = request.json['student_id']
         course_id = request.json['course_id']
         score_value = request.json['grade']
+        version = request.json.get('version')
         # check if student and course exist
         student = Student.query.filter_by(id = student_id).first()
         course = Course.query.filter_by(id=course_id).first()
@@ -263,17 +487,85 @@ class StudentCourseScoreAddView(Resource):
         # check if student is registered for the course
         student_in_course = StudentCourse.query.filter_by(course_id=course.id, student_id=student.id).first() 
         if student_in_course:
-            # check if the student already have a score in the course
-            score = Score.query.filter_by(student_id=student_id, course_id=course_id).first()
-            if score:
-                score.grade = score_value
-            else:
-                # create a new score object and save to database
-                score = Score(student_id=student_id, course_id=course_id , grade=score)
             try:
-                score.save()
-                return {'message': 'Score added successfully'}, HTTPStatus.CREATED
-            except:
+                version = Score.upsert(student_id, course_id, score_value, version)
+                if version is None:
+                    db.session.rollback()
+                    return {'message': 'The score was changed by another request, reload it and retry'}, HTTPStatus.CONFLICT
+                db.session.commit()
+            except SQLAlchemyError:
                 db.session.rollback()
                 return {'message': 'An error occurred while saving student course score'}, HTTPStatus.INTERNAL_SERVER_ERROR
+            if version == 1:
+                return {'message': 'Score added successfully', 'version': version}, HTTPStatus.CREATED
+            return {'message': 'Score updated successfully', 'version': version}, HTTPStatus.OK
         return {'message': 'The student is not registered for this course'}, HTTPStatus.BAD_REQUEST
+
+
+def parse_score_record(record):
+    """ Validate an uploaded score line, returning ((student_id, course_id, grade), error) """
+    if record is None:
+        return None, 'Malformed line'
+    try:
+        student_id = int(record.get('student_id'))
+        course_id = int(record.get('course_id'))
+    except (TypeError, ValueError):
+        return None, 'student_id and course_id must be integers'
+    grade = record.get('grade')
+    if not isinstance(grade, str) or not grade.strip() or len(grade.strip()) > 5:
+        return None, 'grade must be a string of at most 5 characters'
+    return (student_id, course_id, grade.strip()), None
+
+
+@students_namespace.route('/course/scores/bulk')
+class StudentCourseScoreBulkView(Resource):
+
+    @students_namespace.response(HTTPStatus.ACCEPTED, 'Grading queued', bulk_score_accepted_model)
+    @students_namespace.doc(
+        description="""
+        Grade many students at once. The body is streamed as CSV (text/csv, with a
+        student_id,course_id,grade header) or JSON lines (application/x-ndjson) and
+        saved as one background job per chunk, so uploads of any size use constant
+        memory. The jobs are queued once the whole upload is read: an upload that
+        can not be read to the end (400) grades nothing. Poll /jobs/batches/<batch>
+        for the inserted, updated and rejected counts.
+        """
+    )
+    @limiter.limit('bulk')
+    @teacher_required()
+    def post(self):
+        """
+        Grade Student Courses in bulk!
+        """
+        if request.mimetype not in CSV_MIMETYPES + JSON_LINES_MIMETYPES:
+            return {'message': 'Upload must be text/csv or application/x-ndjson'}, HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+        chunk_size = current_app.config.get('GRADE_UPLOAD_CHUNK_SIZE', 1000)
+        max_errors = current_app.config.get('GRADE_UPLOAD_MAX_ERRORS', 100)
+        result = {'batch': str(uuid.uuid4()), 'jobs': 0}
+
+        try:
+            for chunk in chunked(iter_records(request.stream, request.mimetype), chunk_size):
+                payload = {'grades': [], 'lines': [], 'rejected': 0, 'errors': []}
+                for line, record in chunk:
+                    grade, error = parse_score_record(record)
+                    if error:
+                        payload['rejected'] += 1
+                        if len(payload['errors']) < max_errors:
+                            payload['errors'].append({'line': line, 'message': error})
+                    else:
+                        payload['lines'].append(line)
+                        payload['grades'].append(grade)
+                enqueue('scores.grade', payload, batch=result['batch'], held=True)
+                result['jobs'] += 1
+        except IngestError as e:
+            cancel_batch(result['batch'])
+            return {'message': str(e), **result}, HTTPStatus.BAD_REQUEST
+        except Exception:
+            # e.g. the client disconnected mid-upload
+            db.session.rollback()
+            cancel_batch(result['batch'])
+            raise
+        release_batch(result['batch'])
+        return result, HTTPStatus.ACCEPTED
+
@@ -0,0 +1,109 @@
+"""
+Fixtures of the test cases: one app and one schema per process, and every test
+in a transaction rolled back at teardown, so each test starts from an empty
+database without creating and dropping the tables.
+
+    class CourseTestCase(DatabaseTestCase):
+
+        def test_something(self):
+            course_ids = factories.courses(20)
+            ...
+
+During a test, db.session runs the statements meant for the app's engine on a
+single connection in a transaction, so the code under test and the test itself
+work in that transaction, inside a SAVEPOINT: a commit of the code under test
+releases it and a new one starts, a rollback goes back to the last one. After
+the test, the transaction is rolled back, and the app's config and its per-app
+state (cache, metrics, rate limits, replicas) are reset.
+
+Tests that need another config or a database of their own (a file for the ASGI
+mode, replica binds) create their app with create_app as usual.
+"""
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .. import create_app
+from ..config.config import config_dict
+from ..utils import db
+from ..utils.routing import RoutingSession
+from ..utils.startup import namespaces
+
+
+# Per-app state that is created on first use, dropped after every test
+APP_STATE = ('cache', 'metrics', 'ratelimit', 'replicas')
+
+_session = {}
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # pysqlite's own transaction handling does not support SAVEPOINT: SQLAlchemy emits BEGIN instead
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.exec_driver_sql('BEGIN')
+
+
+def _restart_savepoint(session, transaction):
+    savepoint = _session.get('savepoint')
+    if savepoint is not None and not savepoint.is_active:
+        _session['savepoint'] = _session['connection'].begin_nested()
+
+
+class TransactionSession(RoutingSession):
+    """ db.session of the tests: statements for the shared app's engine run on the test's connection """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        bind = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        connection = _session.get('connection')
+        if _session.get('savepoint') is not None and bind is connection.engine:
+            return connection
+        return bind
+
+
+def session_app():
+    """ The app shared by the tests of this process, with its schema created on first use """
+    if 'app' not in _session:
+        app = create_app(config=config_dict['test'])
+        namespaces.load(app)
+        with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', _sqlite_connect)
+                event.listen(db.engine, 'begin', _sqlite_begin)
+            db.create_all()
+            # Also keeps the in-memory database alive
+            connection = db.engine.connect()
+        event.listen(Session, 'after_transaction_end', _restart_savepoint)
+        db.session.session_factory.class_ = TransactionSession
+        _session.update(app=app, connection=connection, config=dict(app.config))
+    return _session['app']
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """ A test case running in the shared app, in a transaction rolled back at teardown """
+
+    def setUp(self):
+        self.app = session_app()
+        self.appctx = self.app.app_context()
+        self.appctx.push()
+        self.client = self.app.test_client()
+
+        connection = _session['connection']
+        self._transaction = connection.begin()
+        _session['savepoint'] = connection.begin_nested()
+
+    def tearDown(self):
+        db.session.remove()
+        _session['savepoint'] = None
+        self._transaction.rollback()
+
+        self.appctx.pop()
+        self.app.config.clear()
+        self.app.config.update(_session['config'])
+        for key in APP_STATE:
+            self.app.extensions.pop(key, None)
+
+        self.app = None
+        self.client = None
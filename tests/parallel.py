@@ -0,0 +1,78 @@
+"""
+Run the tests in parallel processes:
+
+    python -m api.tests.parallel            # one process per CPU
+    python -m api.tests.parallel -j 4 -k search
+
+The test methods are dealt round-robin to the processes. Each process has its
+own app and in-memory database (tests/fixtures.py), so they share nothing.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOP_LEVEL_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+
+
+def test_ids(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from test_ids(test)
+        else:
+            yield test.id()
+
+
+def run_shard(ids):
+    """ Run the tests named `ids`, returning their counts and the reports of the failed ones """
+    stream = io.StringIO()
+    result = unittest.TextTestRunner(stream=stream, verbosity=0).run(
+        unittest.defaultTestLoader.loadTestsFromNames(ids)
+    )
+    return {
+        'run': result.testsRun,
+        'skipped': len(result.skipped),
+        'failures': [(str(test), report) for test, report in result.failures + result.errors],
+    }
+
+
+def run(args):
+    suite = unittest.defaultTestLoader.discover(TESTS_DIR, pattern=args.pattern, top_level_dir=TOP_LEVEL_DIR)
+    ids = [id for id in test_ids(suite) if not args.keyword or args.keyword in id]
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(ids)))
+    shards = [ids[n::jobs] for n in range(jobs)]
+
+    with multiprocessing.Pool(jobs) as pool:
+        return jobs, pool.map(run_shard, shards)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Run the tests in parallel processes')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of processes (default: one per CPU)')
+    parser.add_argument('-k', '--keyword', help='Only run the tests whose ID contains this string')
+    parser.add_argument('-p', '--pattern', default='test*.py', help='Pattern of the test modules')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    sys.path.insert(0, TOP_LEVEL_DIR)
+    started = time.perf_counter()
+    jobs, results = run(parse_args(argv))
+
+    failures = [failure for result in results for failure in result['failures']]
+    for test, report in failures:
+        print('=' * 70, f'FAIL: {test}', '-' * 70, report, sep='\n')
+    tests = sum(result['run'] for result in results)
+    skipped = sum(result['skipped'] for result in results)
+    print(f'Ran {tests} tests in {time.perf_counter() - started:.2f}s with {jobs} processes: '
+          f'{len(failures)} failed, {skipped} skipped')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
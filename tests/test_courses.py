@@ -1,34 +1,34 @@
-import unittest
+import gzip
+import json
+import os
+import tempfile
+import zlib
 from .. import create_app
 from ..config.config import config_dict
 from ..utils import db
+from .fixtures import DatabaseTestCase
+from ..utils.cache import cache
 from ..models.courses import Course
+from ..models.students import Student
+from ..models.studentcourse import StudentCourse
+from ..models.grade import Score
+from ..models.transcript import Transcript
+from ..models.job import Job
+from ..jobs.queue import Worker
+from ..utils.routing import routing
+from ..utils.serializer import compile_model
+from ..courses.views import courses_namespace
+from ..students.views import students_namespace
+from ..jobs.views import jobs_namespace
+from flask_restx import marshal
+from flask_migrate import Migrate, stamp, upgrade
+from alembic.script import ScriptDirectory
 
 
-class CourseTestCase(unittest.TestCase):
-    def setUp(self):
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
 
-        self.app = create_app(config=config_dict['test'])
-
-        self.appctx = self.app.app_context()
-
-        self.appctx.push()
-
-        self.client = self.app.test_client()
-
-        db.create_all()
-
-
-    def tearDown(self):
-
-        db.drop_all()
-
-        self.appctx.pop()
-
-        self.app = None
-
-        self.client = None
 
+class CourseTestCase(DatabaseTestCase):
 
     def test_courses(self):
 
@@ -115,4 +115,500 @@ class CourseTestCase(unittest.TestCase):
 
         # Delete a course
         response = self.client.delete('/courses/1')
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 202
+
+    def test_courses_pagination(self):
+
+        for name in ["BCH101", "CHM101", "PHY101"]:
+            Course(name=name).save()
+
+        # First page
+        response = self.client.get('/courses?limit=2')
+
+        assert response.status_code == 200
+
+        assert [course["name"] for course in response.json] == ["BCH101", "CHM101"]
+
+        cursor = response.headers["X-Next-Cursor"]
+
+        # Last page has no next cursor
+        response = self.client.get(f'/courses?limit=2&after={cursor}')
+
+        assert response.status_code == 200
+
+        assert [course["name"] for course in response.json] == ["PHY101"]
+
+        assert "X-Next-Cursor" not in response.headers
+
+        # Invalid cursor
+        response = self.client.get('/courses?after=not-a-cursor')
+
+        assert response.status_code == 400
+
+
+    def test_bulk_enrollment(self):
+
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Student(id=2, email="two@gmail.com", full_name="Two", date_of_birth="20000101"),
+            Course(name="BCH101"),
+        ])
+        db.session.commit()
+
+        StudentCourse(student_id=1, course_id=1).save()
+
+        data = {"enrollments": [
+            {"student_id": 1, "course_id": 1},
+            {"student_id": 2, "course_id": 1},
+            {"student_id": 2, "course_id": 1},
+            {"student_id": 3, "course_id": 1},
+            {"student_id": 2, "course_id": 9},
+        ]}
+
+        response = self.client.post('/courses/students/batch', json=data)
+
+        assert response.status_code == 200
+
+        assert response.json["enrolled"] == 1
+
+        assert [result["status"] for result in response.json["results"]] == [
+            "already_enrolled", "enrolled", "duplicate", "student_not_found", "course_not_found"
+        ]
+
+        assert StudentCourse.query.count() == 2
+
+
+    def test_course_cache(self):
+
+        Course(name="BCH101").save()
+
+        response = self.client.get('/courses/1')
+
+        assert response.json == {"id": 1, "name": "BCH101"}
+
+        response = self.client.get('/courses/1')
+
+        assert cache.stats()["hits"] == 1
+
+        # Updates invalidate both the course and the catalog pages
+        self.client.get('/courses')
+
+        response = self.client.put('/courses/1', json={"name": "CHM101"})
+
+        assert response.status_code == 200
+
+        assert self.client.get('/courses/1').json == {"id": 1, "name": "CHM101"}
+
+        assert self.client.get('/courses').json == [{"id": 1, "name": "CHM101"}]
+
+
+    def test_metrics(self):
+
+        self.app.config["METRICS_SERVER_TIMING"] = True
+
+        response = self.client.get('/courses')
+
+        assert response.headers["Server-Timing"].startswith("db;dur=")
+
+        response = self.client.get('/admin/metrics')
+
+        assert response.status_code == 200
+
+        assert 'http_requests_total{endpoint="courses_get_create_courses",method="GET",status="200"} 1' in response.text
+
+        assert 'db_statements_per_request_count{endpoint="courses_get_create_courses",method="GET"} 1' in response.text
+
+        self.app.config["METRICS_TOKEN"] = "scraper-token"
+
+        response = self.client.get('/admin/metrics', headers={"Authorization": "Bearer scraper-token"})
+
+        assert response.status_code == 200 and "http_requests_total" in response.text
+
+
+    def test_course_statistics(self):
+
+        db.session.add_all(
+            [Course(name="BCH101"), Course(name="CHM101")] +
+            [Student(id=id, email=f"s{id}@gmail.com", full_name=f"S{id}", date_of_birth="20000101") for id in range(1, 6)]
+        )
+        db.session.commit()
+
+        for student_id, grade in [(1, "A"), (2, "A"), (3, "B"), (4, "C"), (5, None)]:
+            StudentCourse(student_id=student_id, course_id=1).save()
+            if grade:
+                Score(student_id=student_id, course_id=1, grade=grade).save()
+
+        response = self.client.get('/courses/1/statistics')
+
+        assert response.status_code == 200
+
+        assert response.json["enrolled"] == 5
+
+        assert response.json["graded"] == 4
+
+        assert response.json["histogram"] == {"A": 2, "B": 1, "C": 1}
+
+        assert response.json["mean_gpa"] == 3.25
+
+        assert response.json["median_gpa"] == 3.0
+
+        assert response.json["percentiles"]["90"] == 4.0
+
+        response = self.client.get('/courses/statistics')
+
+        # Courses without enrollments are listed too, as on /courses/<id>/statistics
+        assert [(course["course_id"], course["enrolled"], course["graded"]) for course in response.json] == [
+            (1, 5, 4), (2, 0, 0)
+        ]
+
+        assert response.json[1]["histogram"] == {} and response.json[1]["mean_gpa"] is None
+
+        response = self.client.get('/courses/2/statistics')
+
+        assert response.json["enrolled"] == 0
+
+        assert response.json["mean_gpa"] is None
+
+        assert self.client.get('/courses/3/statistics').status_code == 404
+
+
+    def test_course_conditional_requests(self):
+
+        Course(name="BCH101").save()
+
+        response = self.client.get('/courses/1')
+
+        etag = response.headers["ETag"]
+
+        assert "Last-Modified" in response.headers
+
+        response = self.client.get('/courses/1', headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+
+        assert response.data == b""
+
+        Course(name="CHM101").save()
+
+        response = self.client.get('/courses')
+
+        assert "Last-Modified" not in response.headers
+
+        list_etag = response.headers["ETag"]
+
+        assert self.client.get('/courses', headers={"If-None-Match": list_etag}).status_code == 304
+
+        # A deletion does not move the latest updated_at of the list: If-Modified-Since is ignored
+        Course.query.get(2).delete()
+
+        response = self.client.get('/courses', headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+
+        assert response.status_code == 200 and [course["name"] for course in response.json] == ["BCH101"]
+
+        assert self.client.get('/courses', headers={"If-None-Match": list_etag}).status_code == 200
+
+        # A change gives the course a new version
+        self.client.put('/courses/1', json={"name": "CHM101"})
+
+        response = self.client.get('/courses/1', headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+
+        assert response.headers["ETag"] != etag
+
+
+    def test_exports(self):
+
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Course(name="BCH101"),
+            Course(name="CHM101"),
+        ])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+        StudentCourse(student_id=1, course_id=2).save()
+        Score(student_id=1, course_id=2, grade="B").save()
+
+        response = self.client.get('/courses/export/enrollments?course_id=2')
+
+        assert response.status_code == 200
+
+        assert response.is_streamed
+
+        lines = response.get_data(as_text=True).splitlines()
+
+        assert len(lines) == 1
+
+        assert json.loads(lines[0])["course_id"] == 2
+
+        response = self.client.get('/courses/export/scores?format=csv')
+
+        assert response.mimetype == "text/csv"
+
+        lines = response.get_data(as_text=True).splitlines()
+
+        assert lines[0] == "id,student_id,course_id,grade,created_at,updated_at"
+
+        assert lines[1].startswith("1,1,2,B,")
+
+        response = self.client.get('/courses/export/scores?since=2100-01-01')
+
+        assert response.get_data() == b""
+
+    def test_lazy_namespaces(self):
+        app = create_app(config=config_dict['test'])
+
+        def routes():
+            return {rule.rule for rule in app.url_map.iter_rules()}
+
+        assert "/courses/<int:course_id>" not in routes()
+
+        with app.app_context():
+            db.create_all()
+            Course(name="BCH101").save()
+
+            response = app.test_client().get('/courses/1')
+
+            db.drop_all()
+
+        assert response.json == {"id": 1, "name": "BCH101"}
+
+        assert "/courses/<int:course_id>" in routes() and "/jobs/<int:job_id>" in routes()
+
+    def test_migrations_after_create_all(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+        class MigrationConfig(config_dict['test']):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+
+        app = create_app(config=MigrationConfig)
+        Migrate(app, db, directory=MIGRATIONS_DIR)
+        try:
+            with app.app_context():
+                db.create_all()
+                stamp()
+                # A database created from the models has no revision left to apply
+                upgrade()
+                version = db.session.execute(db.text("SELECT version_num FROM alembic_version")).scalar()
+                db.session.remove()
+        finally:
+            os.remove(path)
+
+        assert version == ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+
+    def test_response_compression(self):
+
+        db.session.add_all([Course(name=f"Course {n}") for n in range(40)])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+
+        plain = self.client.get('/courses?limit=40')
+
+        assert "Content-Encoding" not in plain.headers
+
+        assert plain.headers["Vary"] == "Accept-Encoding"
+
+        response = self.client.get('/courses?limit=40', headers={"Accept-Encoding": "gzip, deflate"})
+
+        assert response.headers["Content-Encoding"] == "gzip"
+
+        assert gzip.decompress(response.get_data()) == plain.get_data()
+
+        assert int(response.headers["Content-Length"]) < int(plain.headers["Content-Length"])
+
+        # A compressed body gets a weak ETag, which still validates
+        assert response.headers["ETag"] == "W/" + plain.headers["ETag"]
+
+        response = self.client.get('/courses?limit=40', headers={
+            "Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]
+        })
+
+        assert response.status_code == 304
+
+        # Small bodies are not worth it
+        response = self.client.get('/courses?limit=1', headers={"Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in response.headers
+
+        response = self.client.get('/courses?limit=40', headers={"Accept-Encoding": "gzip;q=0, deflate"})
+
+        assert response.headers["Content-Encoding"] == "deflate"
+
+        # Streamed responses are compressed chunk by chunk
+        response = self.client.get('/courses/export/enrollments', headers={"Accept-Encoding": "deflate"})
+
+        assert response.is_streamed
+
+        assert "Content-Length" not in response.headers
+
+        assert json.loads(zlib.decompress(response.get_data()))["course_id"] == 1
+
+    def test_delete_course_job(self):
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Course(name="BCH101"),
+            Course(name="CHM101"),
+        ])
+        db.session.commit()
+        for course_id, grade in [(1, "A"), (2, "C")]:
+            StudentCourse(student_id=1, course_id=course_id).save()
+            Score(student_id=1, course_id=course_id, grade=grade).save()
+
+        response = self.client.delete('/courses/1')
+
+        assert response.status_code == 202
+
+        job_id = response.json["job_id"]
+
+        response = self.client.get(f'/jobs/{job_id}')
+
+        assert response.status_code == 200
+
+        assert response.json["status"] == "succeeded"
+
+        assert response.json["result"] == {"deleted": 1, "enrollments": 1, "scores": 1}
+
+        assert db.session.get(Course, 1) is None
+
+        assert [score.course_id for score in Score.query] == [2]
+
+        assert Transcript.get_by_student(1).gpa == 2.0
+
+        response = self.client.delete('/courses/1')
+
+        assert response.status_code == 404
+
+    def test_delete_course_invalidates_cache(self):
+        self.app.config['JOBS_EAGER'] = False
+        Course(name="BCH101").save()
+
+        # Cached in this process
+        assert self.client.get('/courses/1').status_code == 200
+
+        assert len(self.client.get('/courses').json) == 1
+
+        response = self.client.delete('/courses/1')
+
+        assert response.status_code == 202
+
+        # With a cache private to each process the deletion runs in the request
+        assert self.client.get(f'/jobs/{response.json["job_id"]}').json["status"] == "succeeded"
+
+        assert self.client.get('/courses/1').status_code == 404
+
+        assert self.client.get('/courses').json == []
+
+    def test_job_worker(self):
+        self.app.config['JOBS_EAGER'] = False
+        # A shared cache (or none): invalidations made by the worker reach the web processes
+        self.app.config['CACHE_TYPE'] = 'null'
+        Course(name="BCH101").save()
+
+        response = self.client.delete('/courses/1')
+
+        assert response.status_code == 202
+
+        job_id = response.json["job_id"]
+
+        assert self.client.get(f'/jobs/{job_id}').json["status"] == "queued"
+
+        Worker(name="test").work(burst=True)
+
+        job = db.session.get(Job, job_id)
+
+        assert (job.status, job.worker, job.attempts) == ("succeeded", "test", 1)
+
+        assert Course.query.count() == 0
+
+    def test_replica_routing(self):
+
+        class ReplicaConfig(config_dict['test']):
+            SQLALCHEMY_BINDS = {'replica_0': 'sqlite://'}
+            CACHE_TYPE = 'null'
+
+        app = create_app(config=ReplicaConfig)
+        client = app.test_client()
+
+        with app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica_0'])
+            Course(name="PRIMARY").save()
+            with db.engines['replica_0'].begin() as connection:
+                connection.execute(Course.__table__.insert().values(id=1, name="REPLICA"))
+
+        try:
+            # Reads of GET requests go to the replica
+            assert client.get('/courses/1').json["name"] == "REPLICA"
+
+            # Writes go to the primary, and the writer then reads from the primary
+            assert client.put('/courses/1', json={"name": "UPDATED"}).status_code == 200
+
+            assert client.get('/courses/1').json["name"] == "UPDATED"
+
+            app.config['REPLICA_STICKY_SECONDS'] = 0
+
+            assert client.get('/courses/1').json["name"] == "REPLICA"
+
+            # Unhealthy replicas are skipped until their next check
+            with app.app_context():
+                replica, = routing.replicas().replicas
+            replica.healthy = False
+
+            assert client.get('/courses/1').json["name"] == "UPDATED"
+        finally:
+            with app.app_context():
+                db.drop_all()
+            # Binds register a metadata on the shared db object
+            db.metadatas.pop('replica_0', None)
+
+    def test_replica_reads_are_not_cached(self):
+
+        class ReplicaConfig(config_dict['test']):
+            SQLALCHEMY_BINDS = {'replica_0': 'sqlite://'}
+
+        app = create_app(config=ReplicaConfig)
+        writer, reader = app.test_client(), app.test_client()
+
+        with app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica_0'])
+            Course(name="BCH101").save()
+            with db.engines['replica_0'].begin() as connection:
+                connection.execute(Course.__table__.insert().values(id=1, name="BCH101"))
+
+        try:
+            assert writer.put('/courses/1', json={"name": "CHM101"}).status_code == 200
+
+            # The replica still has the old name: another client's reads must not cache it
+            assert reader.get('/courses/1').json["name"] == "CHM101"
+
+            assert [course["name"] for course in reader.get('/courses').json] == ["CHM101"]
+
+            with app.app_context():
+                assert cache.backend.get('course:1')["name"] == "CHM101"
+        finally:
+            with app.app_context():
+                db.drop_all()
+            db.metadatas.pop('replica_0', None)
+
+    def test_serializer_matches_marshal(self):
+        Course(name="BCH101").save()
+        course = Course.query.first()
+        row = db.session.query(Course.id, Course.name).first()
+        samples = [
+            {},
+            {"id": 1, "name": "BCH101", "student_id": "2", "histogram": {"A": 1}, "mean_gpa": 3, "extra": 1},
+            {"id": None, "full_name": None, "enrollments": [{"student_id": 1, "course_id": "2"}],
+             "courses": [{"course_id": 1, "grade": "A", "points": 4}], "created_at": course.created_at},
+            course,
+            row,
+        ]
+
+        for namespace in (courses_namespace, students_namespace, jobs_namespace):
+            for model in namespace.models.values():
+                serialize = compile_model(model)
+                for sample in samples:
+                    assert serialize(sample) == marshal(sample, model), model.name
+
+                assert serialize(samples) == marshal(samples, model)
@@ -1,36 +1,32 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
 import unittest
 from .. import create_app
 from ..config.config import config_dict
 from ..utils import db
+from .fixtures import DatabaseTestCase
+from . import factories
 from ..models.teacher import Teacher
 from ..models.courses import Course
 from ..models.students import Student
+from ..models.studentcourse import StudentCourse
+from ..models.grade import Score
+from ..models.transcript import Transcript
 from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from ..utils.asgi import ASGIApp
+from ..utils.async_db import async_db
 
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
 
-class CourseTestCase(unittest.TestCase):
-    def setUp(self):
 
-        self.app = create_app(config=config_dict['test'])
-
-        self.appctx = self.app.app_context()
-
-        self.appctx.push()
-
-        self.client = self.app.test_client()
-
-        db.create_all()
-
-
-    def tearDown(self):
-
-        db.drop_all()
-
-        self.appctx.pop()
-
-        self.app = None
-
-        self.client = None
+class CourseTestCase(DatabaseTestCase):
 
     def test_student_registration(self):
         # Register a Student
@@ -59,4 +55,656 @@ class CourseTestCase(unittest.TestCase):
             "id": "2",
             "email": "teststudent@gmail.com",
             "full_name": "Olubunmi Berry",
-        }]
\ No newline at end of file
+        }]
+
+    def count_queries(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, len(statements)
+
+    def test_student_courses_grade_query_count(self):
+        student = Student(id=1, email="teststudent@gmail.com", full_name="Berry", date_of_birth="20000101")
+        student.save()
+
+        for number in range(1, 41):
+            course = Course(name=f"BCH{number}")
+            course.save()
+            StudentCourse(student_id=student.id, course_id=course.id).save()
+            if number == 1:
+                response, single_course_queries = self.count_queries('/students/1/courses/grade')
+            if number % 2:
+                Score(student_id=student.id, course_id=course.id, grade="A").save()
+
+        response, queries = self.count_queries('/students/1/courses/grade')
+
+        assert response.status_code == 200
+
+        assert len(response.json) == 40
+
+        assert response.json[0] == {"name": "BCH1", "grade": "A"}
+
+        assert response.json[1] == {"name": "BCH2", "grade": None}
+
+        assert queries == single_course_queries
+
+
+    def test_list_endpoints_skip_entities(self):
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Course(name="BCH101"),
+        ])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+        Score(student_id=1, course_id=1, grade="A").save()
+        db.session.expunge_all()
+
+        response, queries = self.count_queries('/courses/1/students')
+
+        assert response.json == [{"id": 1, "course_name": "BCH101", "full_name": "One", "student_id": None}]
+
+        assert queries == 1
+
+        assert self.client.get('/students').json[0]["full_name"] == "One"
+
+        assert self.client.get('/students/1').json["email"] == "one@gmail.com"
+
+        assert self.client.get('/students/1/courses').json == [{"id": 1, "name": "BCH101"}]
+
+        assert self.client.get('/courses').json[0]["name"] == "BCH101"
+
+        # Projections return rows, so nothing was added to the session
+        assert len(db.session.identity_map) == 0
+
+        response = self.client.delete('/students/1')
+
+        assert response.status_code == 200
+
+        assert db.session.get(Transcript, 1) is None
+
+    def test_search(self):
+        db.session.add_all([
+            Student(id=1, email="ada.lovelace@gmail.com", full_name="Ada Lovelace", date_of_birth="20000101"),
+            Student(id=2, email="grace@navy.mil", full_name="Grace Hopper", date_of_birth="20000101"),
+            Student(id=3, email="adam@gmail.com", full_name="Adam Smith", date_of_birth="20000101"),
+            Course(name="Biochemistry"),
+            Course(name="Organic Chemistry"),
+        ])
+        db.session.commit()
+
+        response = self.client.get('/students/search?q=ada')
+
+        assert [student["full_name"] for student in response.json] == ["Ada Lovelace", "Adam Smith"]
+
+        assert [student["full_name"] for student in self.client.get('/students/search?q=navy').json] == ["Grace Hopper"]
+
+        assert self.client.get('/students/search?q=ada love').json[0]["email"] == "ada.lovelace@gmail.com"
+
+        response = self.client.get('/students/search?q=ada&limit=1')
+
+        assert len(response.json) == 1
+
+        response = self.client.get(response.headers["Link"].split(">")[0].strip("<"))
+
+        assert [student["full_name"] for student in response.json] == ["Adam Smith"]
+
+        assert "X-Next-Cursor" not in response.headers
+
+        # The index follows updates and deletes
+        student = Student.query.filter_by(full_name="Grace Hopper").first()
+        student.full_name = "Grace Brewster"
+        db.session.delete(Student.query.filter_by(full_name="Adam Smith").first())
+        db.session.commit()
+
+        assert self.client.get('/students/search?q=hopper').json == []
+
+        assert [student["full_name"] for student in self.client.get('/students/search?q=ada').json] == ["Ada Lovelace"]
+
+        assert self.client.get('/courses/search?q=chem').json == [{"id": 2, "name": "Organic Chemistry"}]
+
+        assert self.client.get('/courses/search?q=bio').json == [{"id": 1, "name": "Biochemistry"}]
+
+        assert self.client.get('/courses/search?q=%20').status_code == 400
+
+    def test_sparse_fieldsets(self):
+        db.session.add(Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"))
+        db.session.commit()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get('/students?fields=full_name')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        assert response.json == [{"full_name": "One"}]
+
+        # Only the requested columns are read, with the pagination and validator keys
+        assert "email" not in statements[0] and "date_of_birth" not in statements[0]
+
+        assert self.client.get('/students/1?fields=id,email').json == {"id": "1", "email": "one@gmail.com"}
+
+        assert self.client.get('/students/search?q=one&fields=email').json == [{"email": "one@gmail.com"}]
+
+        response = self.client.get('/students?fields=full_name,password')
+
+        assert response.status_code == 400
+
+    def test_students_pagination_at_volume(self):
+        student_ids = factories.students(1200)
+
+        ids = []
+        url = '/students?limit=500'
+        while url:
+            response = self.client.get(url)
+            ids.extend(int(student["id"]) for student in response.json)
+            url = response.headers.get("Link", "").split(">")[0].strip("<")
+
+        assert ids == student_ids
+
+    @staticmethod
+    def birth_date(years):
+        """ The YYYYMMDD date of birth of a student turning `years` old around today """
+        return (datetime.date.today() - datetime.timedelta(days=365 * years + 30)).strftime('%Y%m%d')
+
+    def test_single_registration(self):
+        student = {"email": "ada@gmail.com", "full_name": "Ada", "date_of_birth": self.birth_date(years=20)}
+
+        response = self.client.post('/students/register/student', json=student)
+
+        assert response.status_code == 201
+
+        assert Student.query.get(response.json["id"]).email == "ada@gmail.com"
+
+        response = self.client.post('/students/register/student', json=student)
+
+        assert response.status_code == 409 and "already exists" in response.json["message"]
+
+        response = self.client.post('/students/register/student',
+                                    json=dict(student, email="kid@gmail.com", date_of_birth=self.birth_date(years=5)))
+
+        assert response.status_code == 409 and "years old" in response.json["message"]
+
+        assert Student.query.count() == 1
+
+    def test_registration_after_other_users(self):
+        factories.students(2)
+        # A user who is not a student, e.g. a teacher, above the highest student ID
+        db.session.execute(db.metadata.tables['users'].insert(),
+                           list(Student.user_rows([{'id': 5, 'email': 'teacher@school.io', 'full_name': 'Teacher'}])))
+        db.session.commit()
+
+        student = {"email": "ada@gmail.com", "full_name": "Ada", "date_of_birth": self.birth_date(years=20)}
+
+        response = self.client.post('/students/register/student', json=student)
+
+        assert (response.status_code, response.json["id"]) == (201, 6)
+
+        assert Student.query.get(6).email == "ada@gmail.com"
+
+    def test_batch_registration(self):
+        db.session.add(Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"))
+        db.session.commit()
+
+        data = {"students": [
+            {"email": "two@gmail.com", "full_name": "Two", "date_of_birth": "20000101"},
+            {"email": "one@gmail.com", "full_name": "One", "date_of_birth": "20000101"},
+            {"email": "two@gmail.com", "full_name": "Two", "date_of_birth": "20000101"},
+            {"email": "three@gmail", "full_name": "Three", "date_of_birth": "20000101"},
+            {"email": "four@gmail.com", "full_name": "Four", "date_of_birth": "20001301"},
+            {"email": "five@gmail.com", "full_name": "Five", "date_of_birth": self.birth_date(years=5)},
+            {"email": "six@gmail.com", "full_name": "Six"},
+        ]}
+
+        response = self.client.post('/students/register/batch', json=data)
+
+        assert response.status_code == 200
+
+        assert response.json["registered"] == 1
+
+        assert [result["status"] for result in response.json["results"]] == [
+            "registered", "email_exists", "duplicate", "invalid", "invalid", "invalid", "invalid"
+        ]
+
+        assert response.json["results"][0]["id"] == 2
+
+        assert "years old" in response.json["results"][5]["message"]
+
+        assert Student.query.count() == 2
+
+        self.app.config['BULK_REGISTRATION_MAX_RECORDS'] = 2
+
+        response = self.client.post('/students/register/batch', json=data)
+
+        assert response.status_code == 413
+
+    def test_rate_limit(self):
+        self.app.config['RATELIMITS'] = {'students': '2/minute'}
+
+        def register(number, address='10.0.0.1'):
+            return self.client.post('/students/register/student', environ_base={'REMOTE_ADDR': address}, json={
+                "email": f"s{number}@gmail.com", "full_name": f"S{number}", "date_of_birth": "20000101"
+            })
+
+        assert [register(number).status_code for number in range(3)] == [201, 201, 429]
+
+        response = register(3)
+
+        assert response.status_code == 429
+
+        assert 0 < int(response.headers["Retry-After"]) <= 30
+
+        # Other clients have their own budget
+        assert register(4, address='10.0.0.2').status_code == 201
+
+        assert Student.query.count() == 3
+
+        assert 'ratelimit_rejected_total{scope="students"} 2' in self.client.get('/admin/metrics').text
+
+    def test_rate_limit_behind_proxy(self):
+        self.app.config['RATELIMITS'] = {'students': '1/minute'}
+        self.app.config['RATELIMIT_TRUSTED_PROXIES'] = 1
+
+        def register(number, forwarded_for):
+            return self.client.post('/students/register/student', environ_base={'REMOTE_ADDR': '10.0.0.1'},
+                                    headers={'X-Forwarded-For': forwarded_for}, json={
+                "email": f"s{number}@gmail.com", "full_name": f"S{number}", "date_of_birth": "20000101"
+            })
+
+        # Clients behind the proxy have their own budget, despite its one address
+        assert register(1, '203.0.113.5').status_code == 201
+
+        assert register(2, '203.0.113.6').status_code == 201
+
+        # Only the entry added by the proxy is trusted
+        assert register(3, '198.51.100.1, 203.0.113.5').status_code == 429
+
+    def test_rate_limit_replays_idempotent_requests(self):
+        self.app.config['RATELIMITS'] = {'students': '1/minute'}
+        student_id, = factories.students()
+        course_id, = factories.courses()
+        factories.enrollments([(student_id, course_id)])
+
+        def grade(key):
+            return self.client.put('/students/course/add_score', headers={"Idempotency-Key": key}, json={
+                "student_id": student_id, "course_id": course_id, "grade": "A"
+            })
+
+        assert grade("first").status_code == 201
+
+        # A retry replays the response without taking a token
+        response = grade("first")
+
+        assert (response.status_code, response.headers["Idempotent-Replayed"]) == (201, "true")
+
+        assert grade("second").status_code == 429
+
+        # The 429 is not stored: the retry runs once the client has tokens again
+        self.app.config['RATELIMITS'] = {'students': '10/minute'}
+        self.app.extensions.pop('ratelimit')
+
+        response = grade("second")
+
+        assert response.status_code == 200 and "Idempotent-Replayed" not in response.headers
+
+    @unittest.skipIf(aiosqlite is None, 'aiosqlite is not installed')
+    def test_asgi(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+        class AsgiConfig(config_dict['test']):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+            SQLALCHEMY_ECHO = False
+
+        app = create_app(config=AsgiConfig)
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Student(id=1, email="ada@gmail.com", full_name="Ada Lovelace", date_of_birth="20000101"),
+                Student(id=2, email="grace@gmail.com", full_name="Grace Hopper", date_of_birth="20000101"),
+                Course(name="BCH101"),
+            ])
+            db.session.commit()
+        asgi = ASGIApp(app)
+
+        async def request(method, path, query='', body=None):
+            messages = []
+            payload = json.dumps(body).encode() if body is not None else b''
+
+            async def receive():
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await asgi({
+                'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+                'headers': [(b'content-type', b'application/json')] if body is not None else [],
+                'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000),
+            }, receive, send)
+            return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+        async def requests():
+            responses = await asyncio.gather(
+                request('GET', '/students', 'limit=1'),
+                request('GET', '/students/2', 'fields=full_name'),
+                request('GET', '/students/search', 'q=ada'),
+                request('GET', '/students/3'),
+                request('GET', '/students', 'fields=password'),
+                request('GET', '/courses'),
+            )
+            # Endpoints without async handlers run in threads
+            responses.append(await request('POST', '/courses', body={"name": "CHM101"}))
+            responses.append(await request('GET', '/courses'))
+            # The read endpoints went through the async engine
+            assert 'async_engine' in app.extensions
+            await async_db.dispose(app)
+            return responses
+
+        try:
+            responses = asyncio.run(requests())
+        finally:
+            os.remove(path)
+
+        (status, body), *responses = responses
+
+        assert status == 200
+
+        assert json.loads(body) == [
+            {"id": "1", "email": "ada@gmail.com", "full_name": "Ada Lovelace", "date_of_birth": "20000101"}
+        ]
+
+        assert [(status, json.loads(body)) for status, body in responses[:2]] == [
+            (200, {"full_name": "Grace Hopper"}),
+            (200, [{"id": "1", "email": "ada@gmail.com", "full_name": "Ada Lovelace", "date_of_birth": "20000101"}]),
+        ]
+
+        assert [status for status, _ in responses[2:4]] == [404, 400]
+
+        assert json.loads(responses[4][1]) == [{"id": 1, "name": "BCH101"}]
+
+        assert responses[5][0] == 201
+
+        assert json.loads(responses[6][1]) == [{"id": 1, "name": "BCH101"}, {"id": 2, "name": "CHM101"}]
+
+    def test_asgi_streams_request_bodies(self):
+        class AsgiConfig(config_dict['test']):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+            SQLALCHEMY_ECHO = False
+
+        app = create_app(config=AsgiConfig)
+        with app.app_context():
+            db.create_all()
+        events = []
+
+        @app.before_request
+        def dispatched():
+            events.append('dispatched')
+
+        asgi = ASGIApp(app)
+        payload = json.dumps({"name": "CHM101"}).encode()
+        chunks = [payload[:5], payload[5:10], payload[10:]]
+
+        async def receive():
+            events.append('received')
+            chunk = chunks.pop(0)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(asgi({
+            'type': 'http', 'method': 'POST', 'path': '/courses', 'query_string': b'',
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())],
+            'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000),
+        }, receive, send))
+
+        assert messages[0]['status'] == 201
+
+        # The request was dispatched before its body was received, which the app read as it came
+        assert events == ['dispatched', 'received', 'received', 'received']
+
+        with app.app_context():
+            assert [course.name for course in Course.query] == ["CHM101"]
+
+    def test_score_upsert(self):
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Course(name="BCH101"),
+        ])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+
+        score = {"student_id": 1, "course_id": 1, "grade": "A"}
+
+        response = self.client.put('/students/course/add_score', json=score)
+
+        assert response.status_code == 201
+
+        assert response.json["version"] == 1
+
+        response = self.client.put('/students/course/add_score', json=dict(score, grade="B", version=1))
+
+        assert response.status_code == 200
+
+        assert response.json["version"] == 2
+
+        # A write based on an outdated version is rejected
+        response = self.client.put('/students/course/add_score', json=dict(score, grade="C", version=1))
+
+        assert response.status_code == 409
+
+        assert [(score.grade, score.version) for score in Score.query] == [("B", 2)]
+
+        # Retries with the same Idempotency-Key replay the first response
+        headers = {"Idempotency-Key": "grade-1-1"}
+
+        response = self.client.put('/students/course/add_score', json=score, headers=headers)
+
+        assert (response.status_code, response.json["version"]) == (200, 3)
+
+        response = self.client.put('/students/course/add_score', json=score, headers=headers)
+
+        assert (response.status_code, response.json["version"]) == (200, 3)
+
+        assert response.headers["Idempotent-Replayed"] == "true"
+
+        response = self.client.put('/students/course/add_score', json=dict(score, grade="C"), headers=headers)
+
+        assert response.status_code == 422
+
+        # Keys are scoped to the client: another client's request with the same key runs
+        response = self.client.put('/students/course/add_score', json=score, headers=headers,
+                                   environ_overrides={"REMOTE_ADDR": "10.0.0.2"})
+
+        assert (response.status_code, response.json["version"]) == (200, 4)
+
+        assert "Idempotent-Replayed" not in response.headers
+
+        db.session.expire_all()
+
+        assert [(score.grade, score.version) for score in Score.query] == [("A", 4)]
+
+        assert Transcript.get_by_student(1).gpa == 4.0
+
+        # A score loaded before an upsert is expired by it, so its own update is not stale
+        loaded = Score.query.one()
+
+        assert Score.upsert(1, 1, "B") == 5
+
+        loaded.grade = "C"
+        db.session.commit()
+
+        assert (loaded.grade, loaded.version) == ("C", 6)
+
+        # A write based on a score that was deleted since does not recreate it
+        loaded.delete()
+
+        response = self.client.put('/students/course/add_score', json=dict(score, grade="B", version=6))
+
+        assert response.status_code == 409
+
+        assert Score.query.count() == 0
+
+    def test_bulk_score_upload(self):
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Student(id=2, email="two@gmail.com", full_name="Two", date_of_birth="20000101"),
+            Course(name="BCH101"),
+        ])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+        StudentCourse(student_id=2, course_id=1).save()
+        Score(student_id=1, course_id=1, grade="C").save()
+
+        upload = "student_id,course_id,grade\n1,1,A\n2,1,B\n3,1,A\nx,1,A\n"
+
+        response = self.client.post('/students/course/scores/bulk', data=upload, content_type='text/csv')
+
+        assert response.status_code == 202
+
+        assert response.json["jobs"] == 1
+
+        response = self.client.get(f'/jobs/batches/{response.json["batch"]}')
+
+        assert response.status_code == 200
+
+        assert response.json == {
+            "batch": response.json["batch"],
+            "status": "succeeded",
+            "jobs": {"succeeded": 1},
+            "result": {
+                "inserted": 1,
+                "updated": 1,
+                "rejected": 2,
+                "errors": [
+                    {"line": 5, "message": "student_id and course_id must be integers"},
+                    {"line": 4, "message": "The student is not registered for this course"},
+                ],
+            },
+        }
+
+        assert [score.grade for score in Score.query.order_by(Score.student_id)] == ["A", "B"]
+
+        upload = '{"student_id": 2, "course_id": 1, "grade": "C"}\nnot json\n'
+
+        self.app.config['GRADE_UPLOAD_CHUNK_SIZE'] = 1
+
+        response = self.client.post('/students/course/scores/bulk', data=upload, content_type='application/x-ndjson')
+
+        assert response.status_code == 202
+
+        assert response.json["jobs"] == 2
+
+        response = self.client.get(f'/jobs/batches/{response.json["batch"]}')
+
+        assert response.json["result"]["updated"] == 1
+
+        assert response.json["result"]["errors"] == [{"line": 2, "message": "Malformed line"}]
+
+    def test_bulk_score_upload_unreadable(self):
+        student_ids = factories.students(2)
+        course_id, = factories.courses()
+        factories.enrollments((student_id, course_id) for student_id in student_ids)
+
+        # Far more than the decoder reads at once, so chunks are queued before the bad bytes are
+        lines = [f"{student_ids[n % 2]},{course_id},A" for n in range(3000)]
+        upload = ("student_id,course_id,grade\n" + "\n".join(lines) + "\n").encode() + b"\xff\xfe,1,A\n"
+
+        self.app.config['GRADE_UPLOAD_CHUNK_SIZE'] = 500
+
+        response = self.client.post('/students/course/scores/bulk', data=upload, content_type='text/csv')
+
+        assert response.status_code == 400
+
+        assert response.json["jobs"] > 0
+
+        # Nothing of an upload answered with an error is graded
+        assert Score.query.count() == 0
+
+        response = self.client.get(f'/jobs/batches/{response.json["batch"]}')
+
+        assert (response.json["status"], list(response.json["jobs"])) == ("cancelled", ["cancelled"])
+
+    def test_transcript_built_from_primary(self):
+
+        class ReplicaConfig(config_dict['test']):
+            SQLALCHEMY_BINDS = {'replica_0': 'sqlite://'}
+
+        app = create_app(config=ReplicaConfig)
+
+        with app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica_0'])
+            student = {"id": 1, "email": "one@gmail.com", "full_name": "One", "date_of_birth": "20000101"}
+            db.session.add_all([Student(**student), Course(name="BCH101")])
+            db.session.commit()
+            # Graded before transcripts existed; the replica has not received the score yet
+            db.session.execute(Score.__table__.insert().values(student_id=1, course_id=1, grade="A"))
+            db.session.commit()
+            with db.engines['replica_0'].begin() as connection:
+                connection.execute(Student.__table__.insert().values(**student))
+
+        try:
+            response = app.test_client().get('/students/1/transcript')
+
+            assert (response.json["credits"], response.json["gpa"]) == (1, 4.0)
+
+            with app.app_context():
+                assert db.session.get(Transcript, 1).credits == 1
+        finally:
+            with app.app_context():
+                db.drop_all()
+            db.metadatas.pop('replica_0', None)
+
+    def test_student_transcript(self):
+        db.session.add_all([
+            Student(id=1, email="one@gmail.com", full_name="One", date_of_birth="20000101"),
+            Course(name="BCH101"),
+            Course(name="CHM101"),
+        ])
+        db.session.commit()
+        StudentCourse(student_id=1, course_id=1).save()
+        StudentCourse(student_id=1, course_id=2).save()
+
+        response = self.client.get('/students/1/transcript')
+
+        assert response.status_code == 200
+
+        assert response.json == {"student_id": 1, "gpa": None, "credits": 0, "courses": []}
+
+        Score(student_id=1, course_id=1, grade="A").save()
+        score = Score(student_id=1, course_id=2, grade="C")
+        score.save()
+
+        response = self.client.get('/students/1/transcript')
+
+        assert response.json["credits"] == 2
+
+        assert response.json["gpa"] == 3.0
+
+        assert [course["grade"] for course in response.json["courses"]] == ["A", "C"]
+
+        score.delete()
+
+        assert self.client.get('/students/1/transcript').json["credits"] == 1
+
+        response = self.client.post('/students/course/scores/bulk', data="student_id,course_id,grade\n1,2,B\n",
+                                    content_type='text/csv')
+
+        assert self.client.get('/students/1/transcript').json["gpa"] == 3.5
+
+        assert self.client.get('/students/2/transcript').status_code == 404
@@ -0,0 +1,241 @@
+"""
+Serve the Flask app over ASGI (asgi.py), for uvicorn or gunicorn's uvicorn
+workers.
+
+Flask 2.2 and flask-restx dispatch requests synchronously, so a slow query
+holds a whole thread. Under ASGIApp, a request whose resource defines an async
+handler for its method (`async_get` next to `get`) runs on the event loop:
+while its queries wait on the async driver (utils/async_db.py) the loop serves
+other requests. The request still goes through the app as usual: before and
+after request hooks (metrics, compression), error handlers and teardown.
+Every other request runs the WSGI app in one of ASGI_THREADS threads, exactly
+as under gunicorn.
+
+Requests run in threads read their body as the app consumes it: the thread
+waits on the event loop for each message of the body, which is never held
+whole in memory. Requests with an async handler read it whole first.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+from flask_restx.utils import unpack
+from werkzeug.wrappers import Response
+
+from ..utils.async_db import async_db
+from ..utils.serializer import json_response
+from ..utils.startup import namespaces
+
+
+class RequestBody(io.RawIOBase):
+    """
+    The body of an ASGI request, received message by message. Read from a
+    thread, it waits for the event loop to receive each message; the loop
+    reads it with `read_all`.
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = b''
+        self.done = False
+
+    async def next_chunk(self):
+        if self.done:
+            return b''
+        message = await self.receive()
+        # A client that disconnects ends the body early
+        if message['type'] == 'http.disconnect' or not message.get('more_body'):
+            self.done = True
+        return message.get('body', b'')
+
+    async def read_all(self):
+        chunks = [self.pending]
+        self.pending = b''
+        while not self.done:
+            chunks.append(await self.next_chunk())
+        return b''.join(chunks)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and not self.done:
+            self.pending = asyncio.run_coroutine_threadsafe(self.next_chunk(), self.loop).result()
+        size = min(len(buffer), len(self.pending))
+        buffer[:size], self.pending = self.pending[:size], self.pending[size:]
+        return size
+
+
+def build_environ(scope, body):
+    """ The WSGI environ of an ASGI HTTP request, whose body is the file `body` """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    # Without a length (chunked), the body ends with the last message
+    environ['wsgi.input_terminated'] = 'CONTENT_LENGTH' not in environ
+    return environ
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class ASGIApp:
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        # Requests are routed here, without going through app.wsgi_app, where lazy namespaces load
+        namespaces.load(app)
+        # Single thread executors: each request runs in one thread from start to close,
+        # as its database connection (and a streamed response's cursor) may be tied to it
+        self.executors = [
+            ThreadPoolExecutor(1, thread_name_prefix=f'asgi-{n}')
+            for n in range(threads or app.config.get('ASGI_THREADS', 5))
+        ]
+        self._idle = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose(self.app)
+                for executor in self.executors:
+                    executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = RequestBody(receive, asyncio.get_running_loop())
+        environ = build_environ(scope, io.BufferedReader(body))
+
+        context = self.app.request_context(environ)
+        context.push()
+        handler = self.async_handler()
+        if handler is None:
+            context.pop()
+            await self.run_in_thread(environ, send)
+            return
+
+        # Nothing read the body yet: hand the handler one read whole, off the stream
+        data = await body.read_all()
+        environ['wsgi.input'], environ['CONTENT_LENGTH'] = io.BytesIO(data), str(len(data))
+        environ['wsgi.input_terminated'] = False
+
+        try:
+            response = await self.dispatch(handler)
+        finally:
+            context.pop()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': _encode_headers(response.headers.items()),
+        })
+        try:
+            for chunk in response.iter_encoded():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def async_handler(self):
+        """ The async handler of the matched resource for the request method, if it has one """
+        if request.routing_exception is not None or request.url_rule is None:
+            return None
+        view = self.app.view_functions.get(request.url_rule.endpoint)
+        name = f'async_{request.method.lower()}'
+        if not hasattr(getattr(view, 'view_class', None), name):
+            return None
+        # The resources take no arguments besides the Api, which the async handlers do not use
+        return getattr(view.view_class(), name)
+
+    async def dispatch(self, handler):
+        """ Like Flask.full_dispatch_request, awaiting the handler """
+        app = self.app
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await handler(**request.view_args)
+                    if not isinstance(rv, Response):
+                        # As restx does with the return value of a resource method, for JSON
+                        rv = json_response(*unpack(rv))
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.finalize_request(rv)
+        except Exception as e:
+            return app.handle_exception(e)
+
+    async def run_in_thread(self, environ, send):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for executor in self.executors:
+                self._idle.put_nowait(executor)
+        executor = await self._idle.get()
+        try:
+            await self._run_in_thread(executor, environ, send)
+        finally:
+            self._idle.put_nowait(executor)
+
+    async def _run_in_thread(self, executor, environ, send):
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def step(function, *args):
+            return loop.run_in_executor(executor, function, *args)
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        iterable = await step(self.app, environ, start_response)
+        try:
+            # Streamed responses, like the exports, produce their chunks in the thread too
+            chunks = iter(iterable)
+            chunk = await step(next, chunks, None)
+            await send({
+                'type': 'http.response.start',
+                'status': started['status'],
+                'headers': _encode_headers(started['headers']),
+            })
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await step(next, chunks, None)
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await step(close)
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,60 @@
+"""
+Async database access for the async handlers of the ASGI mode (utils/asgi.py).
+
+The async engine is created per app on first use, from ASYNC_DATABASE_URL or
+else from SQLALCHEMY_DATABASE_URI with its driver swapped for asyncpg
+(Postgres) or aiosqlite (SQLite), which must be installed. Queries are built
+as usual, with the models and the query helpers, and executed with an
+AsyncSession instead of db.session:
+
+    async with async_db.session() as session:
+        rows = (await session.execute(student_rows().statement)).all()
+"""
+from flask import current_app
+from sqlalchemy.engine import make_url
+
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """ `url` with the async driver of its database """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for '{backend}' databases; set ASYNC_DATABASE_URL.")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncDatabase:
+
+    @property
+    def engine(self):
+        engine = current_app.extensions.get('async_engine')
+        if engine is None:
+            # Imported on first use: only the ASGI mode needs sqlalchemy.ext.asyncio
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            url = current_app.config.get('ASYNC_DATABASE_URL') or async_url(current_app.config['SQLALCHEMY_DATABASE_URI'])
+            engine = current_app.extensions.setdefault('async_engine', create_async_engine(
+                url, **current_app.config.get('ASYNC_ENGINE_OPTIONS', {})
+            ))
+        return engine
+
+    def session(self):
+        """ A new AsyncSession, to use as an async context manager """
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        return AsyncSession(self.engine, expire_on_commit=False)
+
+    @staticmethod
+    async def dispose(app):
+        engine = app.extensions.pop('async_engine', None)
+        if engine is not None:
+            await engine.dispose()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,252 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from flask import current_app
+
+from ..utils.routing import routing
+
+
+class CacheBackend:
+    """
+    Storage used by `Cache`. `get` returns None on a miss, so None can not be
+    cached. Any object with the same four methods can be used as a backend.
+    `local` backends are private to each process: invalidations made in one
+    process (e.g. a job worker) never reach the others.
+    """
+    local = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process least recently used cache with a per entry time to live.
+    Every gunicorn worker has its own copy, so an invalidation in one worker
+    only reaches the others once their entries expire.
+    """
+    local = True
+
+    def __init__(self, max_entries=10000, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by all workers, stored through a Redis client (or anything
+    with the same get/set/delete/scan_iter methods, such as fakeredis).
+    """
+
+    def __init__(self, client, default_ttl=300, prefix='school:'):
+        self.client = client
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_backend(app_config):
+    backend = app_config.get('CACHE_BACKEND')
+    if backend is not None:
+        return backend
+
+    cache_type = app_config.get('CACHE_TYPE', 'lru')
+    default_ttl = app_config.get('CACHE_DEFAULT_TTL', 300)
+    if cache_type == 'null':
+        return NullCache()
+    if cache_type == 'lru':
+        return LRUCache(app_config.get('CACHE_MAX_ENTRIES', 10000), default_ttl)
+    if cache_type == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_TYPE 'redis' requires the redis package")
+        client = redis.Redis.from_url(app_config['CACHE_REDIS_URL'])
+        return RedisCache(client, default_ttl)
+    raise ValueError(f"Unknown CACHE_TYPE '{cache_type}'")
+
+
+class _CacheState:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+class Cache:
+    """
+    Read-through cache for model lookups. The backend and the hit/miss
+    counters are kept per application and created from its config on first use.
+
+    Groups of keys (e.g. every page of the course list) are invalidated
+    together by including a namespace version in the key and replacing the
+    version with `bump`.
+    """
+
+    def init_app(self, app):
+        app.extensions['cache'] = _CacheState(make_backend(app.config))
+
+    @property
+    def _state(self):
+        state = current_app.extensions.get('cache')
+        if state is None:
+            self.init_app(current_app)
+            state = current_app.extensions['cache']
+        return state
+
+    @property
+    def backend(self):
+        return self._state.backend
+
+    @property
+    def local(self):
+        """ Whether the backend is private to this process """
+        return getattr(self.backend, 'local', False)
+
+    def get_or_set(self, key, loader, ttl=None):
+        state = self._state
+        value = state.backend.get(key)
+        if value is not None:
+            with state.lock:
+                state.hits += 1
+            return value
+
+        with state.lock:
+            state.misses += 1
+        # Cached values are served to every client, so they are read from the primary: a
+        # lagging replica would keep old rows cached after their invalidation
+        with nullcontext() if isinstance(state.backend, NullCache) else routing.primary():
+            value = loader()
+        if value is not None:
+            state.backend.set(key, value, ttl)
+        return value
+
+    async def get_or_set_async(self, key, loader, ttl=None):
+        """ get_or_set with a coroutine function as the loader """
+        state = self._state
+        value = state.backend.get(key)
+        if value is not None:
+            with state.lock:
+                state.hits += 1
+            return value
+
+        with state.lock:
+            state.misses += 1
+        value = await loader()
+        if value is not None:
+            state.backend.set(key, value, ttl)
+        return value
+
+    def delete(self, *keys):
+        self._state.backend.delete(*keys)
+
+    def version(self, namespace):
+        key = f'version:{namespace}'
+        version = self.backend.get(key)
+        if version is None:
+            version = self.bump(namespace)
+        return version
+
+    def bump(self, namespace):
+        version = uuid.uuid4().hex
+        self.backend.set(f'version:{namespace}', version, ttl=0)
+        return version
+
+    def versioned_key(self, namespace, *parts):
+        return ':'.join([namespace, self.version(namespace)] + [str(part) for part in parts])
+
+    def stats(self):
+        state = self._state
+        with state.lock:
+            hits, misses = state.hits, state.misses
+        lookups = hits + misses
+        return {
+            'backend': type(state.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+
+cache = Cache()
@@ -0,0 +1,123 @@
+"""
+Compression of response bodies, negotiated with Accept-Encoding.
+
+Brotli (when the brotli package is installed), gzip or deflate, in that order
+of preference among the encodings the client accepts. Bodies smaller than
+COMPRESS_MIN_SIZE bytes are sent as they are. Streamed responses, like the
+exports, are compressed chunk by chunk and each chunk is flushed, so clients
+still receive rows as they are read.
+"""
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain',
+)
+
+# wbits of zlib: gzip framing, and the zlib framing HTTP calls deflate
+ZLIB_WBITS = {'gzip': 31, 'deflate': 15}
+
+
+class ZlibCompressor:
+
+    def __init__(self, encoding, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, ZLIB_WBITS[encoding])
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        # Ends the wrapped stream, and its request context, when the client goes away
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class Compression:
+    """ Compresses the responses of an app, see the module docstring """
+
+    def init_app(self, app):
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def encodings():
+        return ('br', 'gzip', 'deflate') if brotli is not None else ('gzip', 'deflate')
+
+    def compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(current_app.config.get('COMPRESS_BROTLI_QUALITY', 4))
+        return ZlibCompressor(encoding, current_app.config.get('COMPRESS_LEVEL', 6))
+
+    def _after_request(self, response):
+        if (not current_app.config.get('COMPRESS_ENABLED', True)
+                or response.mimetype not in current_app.config.get('COMPRESS_MIMETYPES', COMPRESSIBLE_MIMETYPES)):
+            return response
+        # The body depends on the Accept-Encoding of the request, compressed or not
+        response.vary.add('Accept-Encoding')
+
+        if (request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.cache_control.no_transform):
+            return response
+
+        encoding = request.accept_encodings.best_match(self.encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, self.compressor(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', 500):
+                return response
+            compressor = self.compressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is not byte for byte the representation the ETag named
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compression = Compression()
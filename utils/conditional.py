@@ -0,0 +1,54 @@
+import hashlib
+from datetime import timezone
+
+from flask import Response, request
+from werkzeug.http import http_date, quote_etag
+
+
+def _value(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name, None)
+
+
+def get_validators(rows, *extra):
+    """
+    ETag and Last-Modified of a response made of `rows` (model instances or
+    their cached dicts), from each row's id and updated_at. `extra` is mixed
+    into the ETag for anything else the response depends on, like a next cursor.
+    """
+    versions = [(_value(row, 'id'), _value(row, 'updated_at')) for row in rows]
+    etag = hashlib.sha1(repr((versions, extra)).encode()).hexdigest()
+
+    timestamps = [updated_at for _, updated_at in versions if updated_at is not None]
+    last_modified = None
+    if timestamps:
+        # Stored as naive UTC; HTTP dates have a one second resolution
+        last_modified = max(timestamps).replace(tzinfo=timezone.utc, microsecond=0)
+    return etag, last_modified
+
+
+def conditional_headers(etag, last_modified=None):
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag, last_modified=None):
+    """
+    A 304 response when the request's If-None-Match (or, without it,
+    If-Modified-Since) shows the client already has this version, else None.
+    Collections pass no last_modified: removing one of their rows does not
+    move the latest updated_at, so only their ETag tells the change.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matches = last_modified <= request.if_modified_since
+    else:
+        matches = False
+
+    if matches:
+        return Response(status=304, headers=conditional_headers(etag, last_modified))
+    return None
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import Response, current_app, stream_with_context
+
+from ..utils import db
+
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _format_batch(rows, columns, format):
+    if format == 'ndjson':
+        return ''.join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + '\n' for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row] for row in rows
+    )
+    return buffer.getvalue()
+
+
+def iter_export(statement, format, batch_size):
+    """
+    Encode the rows of a Core select as NDJSON or CSV, one chunk per batch.
+    Rows come from a server side cursor `batch_size` at a time, so memory use
+    does not depend on the number of rows.
+    """
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    columns = list(result.keys())
+    try:
+        if format == 'csv':
+            yield _format_batch([columns], columns, format).encode()
+        for rows in result.partitions():
+            yield _format_batch(rows, columns, format).encode()
+    finally:
+        result.close()
+
+
+def export_response(statement, format, filename):
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 5000)
+    return Response(
+        stream_with_context(iter_export(statement, format, batch_size)),
+        mimetype=EXPORT_MIMETYPES[format],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{format}'},
+    )
@@ -0,0 +1,113 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from http import HTTPStatus
+
+from flask import current_app, request
+from flask_restx.utils import unpack
+from sqlalchemy.exc import IntegrityError
+from werkzeug.wrappers import Response
+
+from ..models.idempotency import IdempotencyKey
+from ..utils import db
+from ..utils.ratelimit import client_key
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Swagger documentation of the header, for the params of Namespace.doc
+IDEMPOTENCY_PARAM = {
+    'in': 'header',
+    'description': "Optional unique key; retrying with the same key replays the first response "
+                   "instead of running the request again",
+}
+
+
+def fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def claim(client, key, request_fingerprint):
+    """
+    Record that a request of `client` is running with `key`. Returns None when this
+    request claimed the key, else the IdempotencyKey of an earlier request with it.
+    """
+    ttl = timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+    existing = db.session.get(IdempotencyKey, (client, key))
+    if existing is not None and existing.created_at < datetime.utcnow() - ttl:
+        db.session.delete(existing)
+        db.session.commit()
+        existing = None
+
+    if existing is None:
+        db.session.add(IdempotencyKey(client=client, key=key, fingerprint=request_fingerprint))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            # Claimed by a concurrent request with the same key
+            db.session.rollback()
+            existing = db.session.get(IdempotencyKey, (client, key))
+    return existing
+
+
+def idempotent(function):
+    """
+    Make a write endpoint safe to retry: the first request with a given
+    Idempotency-Key header runs and its response is stored; later requests
+    of the same client with the key get that response back (with an
+    Idempotent-Replayed header) without running again. Keys are scoped to the
+    client, its JWT identity or address, so clients picking the same key do
+    not see each other's responses. Responses with a 5xx or 429 status are
+    not stored, so the request can be retried. Requests without the header
+    run as usual.
+
+    A rate limit goes under this decorator, so replays do not take tokens.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return function(*args, **kwargs)
+        if len(key) > 255:
+            return {'message': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'}, HTTPStatus.BAD_REQUEST
+
+        client = client_key()
+        request_fingerprint = fingerprint()
+        existing = claim(client, key, request_fingerprint)
+        if existing is not None:
+            if existing.fingerprint != request_fingerprint:
+                return {'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}, \
+                    HTTPStatus.UNPROCESSABLE_ENTITY
+            if existing.status_code is None:
+                return {'message': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'}, \
+                    HTTPStatus.CONFLICT
+            return existing.response, existing.status_code, {REPLAYED_HEADER: 'true'}
+
+        try:
+            resp = function(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            release(client, key)
+            raise
+
+        data, code, _ = unpack(resp)
+        if isinstance(resp, Response) or code >= 500 or code == HTTPStatus.TOO_MANY_REQUESTS:
+            release(client, key)
+        else:
+            record = db.session.get(IdempotencyKey, (client, key))
+            record.status_code = code
+            record.response = data
+            db.session.commit()
+        return resp
+    return wrapper
+
+
+def release(client, key):
+    db.session.query(IdempotencyKey).filter(
+        IdempotencyKey.client == client, IdempotencyKey.key == key
+    ).delete(synchronize_session=False)
+    db.session.commit()
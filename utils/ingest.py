@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from itertools import islice
+
+
+CSV_MIMETYPES = ('text/csv',)
+JSON_LINES_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+
+class IngestError(ValueError):
+    """ Raised for an upload that can not be parsed at all """
+
+
+def iter_records(stream, mimetype, encoding='utf-8'):
+    """
+    Lazily parse a binary upload stream of CSV (with a header row) or
+    JSON lines into dicts, yielding (line_number, record) one at a time.
+    Malformed lines are yielded as (line_number, None).
+    """
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    try:
+        if mimetype in CSV_MIMETYPES:
+            reader = csv.DictReader(text)
+            for record in reader:
+                yield reader.line_num, record
+        elif mimetype in JSON_LINES_MIMETYPES:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_number, record if isinstance(record, dict) else None
+        else:
+            raise IngestError(f"Unsupported content type '{mimetype}'")
+    except UnicodeDecodeError:
+        raise IngestError(f"Upload is not valid {encoding}")
+    finally:
+        text.detach()
+
+
+def chunked(iterable, size):
+    """ Yield lists of at most `size` items without materializing `iterable` """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
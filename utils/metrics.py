@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def samples(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket', dict(labels, le=str(bound)), count
+        yield f'{name}_bucket', dict(labels, le='+Inf'), self.count
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class MetricsRegistry:
+    """ Per worker request metrics, keyed by (endpoint, method) """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.statements = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))
+        self.db_time = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def observe_request(self, endpoint, method, status, duration, statement_count, db_duration):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.latency[(endpoint, method)].observe(duration)
+            self.statements[(endpoint, method)].observe(statement_count)
+            self.db_time[(endpoint, method)] += db_duration
+
+    def increment(self, name, amount=1, **labels):
+        """ Count an event for a named counter, exported as <name>_total """
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def snapshot(self):
+        with self.lock:
+            requests = dict(self.requests)
+            latency = {key: list(histogram.samples('http_request_duration_seconds', self._labels(key)))
+                       for key, histogram in self.latency.items()}
+            statements = {key: list(histogram.samples('db_statements_per_request', self._labels(key)))
+                          for key, histogram in self.statements.items()}
+            db_time = dict(self.db_time)
+            counters = dict(self.counters)
+        return requests, latency, statements, db_time, counters
+
+    @staticmethod
+    def _labels(key):
+        endpoint, method = key
+        return {'endpoint': endpoint, 'method': method}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    if has_request_context() and 'request_started_at' in g:
+        g.sql_statements += 1
+        g.sql_duration += elapsed
+
+
+class Metrics:
+    """
+    Records latency, SQL statement count and database time of every request
+    handled by the application, per endpoint. SQL statements are counted
+    through SQLAlchemy engine events, so they include statements issued by
+    any engine (primary or replica) during the request.
+
+    Each gunicorn worker keeps its own registry; a scrape returns the
+    metrics of the worker that answered it.
+    """
+
+    _engine_events_registered = False
+
+    def init_app(self, app):
+        app.extensions['metrics'] = MetricsRegistry()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if not Metrics._engine_events_registered:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            Metrics._engine_events_registered = True
+
+    @property
+    def registry(self):
+        registry = current_app.extensions.get('metrics')
+        if registry is None:
+            registry = current_app.extensions.setdefault('metrics', MetricsRegistry())
+        return registry
+
+    def increment(self, name, amount=1, **labels):
+        self.registry.increment(name, amount, **labels)
+
+    @staticmethod
+    def _before_request():
+        g.request_started_at = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_duration = 0.0
+
+    def _after_request(self, response):
+        if 'request_started_at' not in g:
+            return response
+        duration = time.perf_counter() - g.request_started_at
+        endpoint = request.endpoint or 'unmatched'
+        self.registry.observe_request(
+            endpoint, request.method, response.status_code, duration, g.sql_statements, g.sql_duration
+        )
+        if current_app.config.get('METRICS_SERVER_TIMING', False):
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={g.sql_duration * 1000:.2f};desc="{g.sql_statements} queries", '
+                f'app;dur={duration * 1000:.2f}'
+            )
+        return response
+
+    def render(self, extra=()):
+        """
+        Render the metrics in the Prometheus text exposition format.
+        `extra` is an iterable of (name, type, help, [(labels, value), ...])
+        for gauges and counters owned by other subsystems.
+        """
+        requests, latency, statements, db_time, counters = self.registry.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {value}')
+
+        family('http_requests_total', 'counter', 'Requests handled, by endpoint, method and status.', [
+            ('http_requests_total', {'endpoint': endpoint, 'method': method, 'status': status}, count)
+            for (endpoint, method, status), count in sorted(requests.items())
+        ])
+        family('http_request_duration_seconds', 'histogram', 'Request latency.', [
+            sample for key in sorted(latency) for sample in latency[key]
+        ])
+        family('db_statements_per_request', 'histogram', 'SQL statements executed per request.', [
+            sample for key in sorted(statements) for sample in statements[key]
+        ])
+        family('db_duration_seconds_total', 'counter', 'Time spent executing SQL statements.', [
+            ('db_duration_seconds_total', {'endpoint': endpoint, 'method': method}, seconds)
+            for (endpoint, method), seconds in sorted(db_time.items())
+        ])
+
+        by_name = defaultdict(list)
+        for (name, labels), value in sorted(counters.items()):
+            by_name[name].append((f'{name}_total', dict(labels), value))
+        for name, samples in by_name.items():
+            family(f'{name}_total', 'counter', f'{name.replace("_", " ").capitalize()}.', samples)
+
+        for name, kind, help_text, samples in extra:
+            family(name, kind, help_text, [(name, labels, value) for labels, value in samples])
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
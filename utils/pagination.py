@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+from urllib.parse import urlencode
+
+from flask import current_app, request
+from flask_restx import abort, reqparse
+from http import HTTPStatus
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+pagination_parser = reqparse.RequestParser()
+pagination_parser.add_argument(
+    'limit', type=int, location='args',
+    help='Maximum number of items to return'
+)
+pagination_parser.add_argument(
+    'after', type=str, location='args',
+    help='Opaque cursor returned in the X-Next-Cursor header of the previous page'
+)
+
+search_parser = pagination_parser.copy()
+search_parser.add_argument(
+    'q', type=str, location='args', required=True,
+    help='Search terms; words match as prefixes, best matches first'
+)
+
+
+def encode_cursor(value):
+    payload = json.dumps(value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        abort(HTTPStatus.BAD_REQUEST, f"Invalid cursor '{cursor}'.")
+
+
+class CursorPage:
+    """ A single page of a keyset paginated query """
+
+    def __init__(self, items, limit, next_cursor=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+
+    def headers(self):
+        if self.next_cursor is None:
+            return {}
+        # Other arguments, such as a search query, carry over to the next page
+        args = dict(request.args.items(), limit=self.limit, after=self.next_cursor)
+        next_url = f"{request.base_url}?{urlencode(args)}"
+        return {
+            'X-Next-Cursor': self.next_cursor,
+            'Link': f'<{next_url}>; rel="next"',
+        }
+
+
+def get_limit(limit=None):
+    default_limit = current_app.config.get('PAGINATION_DEFAULT_LIMIT', DEFAULT_LIMIT)
+    max_limit = current_app.config.get('PAGINATION_MAX_LIMIT', MAX_LIMIT)
+    if limit is None:
+        return default_limit
+    if limit < 1:
+        abort(HTTPStatus.BAD_REQUEST, "'limit' must be a positive integer.")
+    return min(limit, max_limit)
+
+
+def get_page_args():
+    """ The validated (limit, after) pagination arguments of the current request """
+    args = pagination_parser.parse_args()
+    limit = get_limit(args.get('limit'))
+
+    after = None
+    if args.get('after'):
+        after = decode_cursor(args['after'])
+        if not isinstance(after, int) or isinstance(after, bool):
+            abort(HTTPStatus.BAD_REQUEST, f"Invalid cursor '{args['after']}'.")
+    return limit, after
+
+
+def get_search_args():
+    """ The validated (q, limit, offset) arguments of a search request; its cursor holds an offset """
+    args = search_parser.parse_args()
+    term = args['q'].strip()
+    if not term:
+        abort(HTTPStatus.BAD_REQUEST, "'q' must not be empty.")
+    limit, offset = get_page_args()
+    if offset is not None and offset < 0:
+        abort(HTTPStatus.BAD_REQUEST, f"Invalid cursor '{args['after']}'.")
+    return term, limit, offset
+
+
+def _keyset(query, key_column, limit, after):
+    if after is not None:
+        query = query.filter(key_column > after)
+    return query.order_by(key_column).limit(limit + 1)
+
+
+def _keyset_page(rows, key_column, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+    return CursorPage(rows, limit, next_cursor)
+
+
+def paginate(query, key_column, limit=None, after=None):
+    """
+    Keyset paginate `query` on `key_column` (a unique, indexed column, usually
+    the primary key). Without an explicit `limit` the `limit` and `after`
+    request arguments are used. One extra row is fetched to know whether
+    a next page exists.
+    """
+    if limit is None:
+        limit, after = get_page_args()
+    return _keyset_page(_keyset(query, key_column, limit, after).all(), key_column, limit)
+
+
+async def paginate_async(session, query, key_column, limit=None, after=None):
+    """ paginate, running the query on an AsyncSession """
+    if limit is None:
+        limit, after = get_page_args()
+    result = await session.execute(_keyset(query, key_column, limit, after).statement)
+    return _keyset_page(result.all(), key_column, limit)
+
+
+def _offset_page(rows, limit, offset):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(offset + limit)
+    return CursorPage(rows, limit, next_cursor)
+
+
+def offset_page(query, limit, offset=None):
+    """ A page of `query` for orders that can not be keyset paginated, like search ranks: the cursor holds an offset """
+    offset = offset or 0
+    return _offset_page(query.limit(limit + 1).offset(offset).all(), limit, offset)
+
+
+async def offset_page_async(session, query, limit, offset=None):
+    """ offset_page, running the query on an AsyncSession """
+    offset = offset or 0
+    result = await session.execute(query.limit(limit + 1).offset(offset).statement)
+    return _offset_page(result.all(), limit, offset)
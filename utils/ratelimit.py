@@ -0,0 +1,209 @@
+"""
+Token bucket rate limiting of the write endpoints, per client.
+
+Every client has a bucket per scope (a namespace, or "bulk" for the bulk
+endpoints) holding up to N tokens and refilled continuously at N per period,
+from the RATELIMITS config ("<N>/<second|minute|hour>"). A request takes a
+token; when none is left it is answered with 429 Too Many Requests and a
+Retry-After header, and counted in the ratelimit_rejected metric. So a client
+can burst N requests, then keeps to N per period on average.
+
+Clients are identified by the identity of their JWT when they send a valid
+one, else by their address. Behind RATELIMIT_TRUSTED_PROXIES reverse proxies
+(load balancer, nginx) the address is the one the outermost of them saw, read
+from X-Forwarded-For; with the default of 0 every client would otherwise share
+the proxy's address, and with it a single bucket.
+
+On endpoints that are also @idempotent, the limit goes under that decorator,
+so replayed responses do not take tokens.
+
+Buckets live in the worker's memory (RATELIMIT_STORAGE 'memory', a client's
+budget is then per worker) or in Redis ('redis', shared by all workers). Any
+object with a `take` method like MemoryStore's can be used as the store with
+RATELIMIT_STORE. When Redis can not be reached, requests are let through.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from http import HTTPStatus
+
+from flask import current_app, request
+
+from ..utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+def parse_limit(limit):
+    """ (capacity, tokens per second) of a "<N>/<period>" limit """
+    try:
+        count, period = limit.split('/')
+        count, seconds = int(count), PERIODS[period.strip()]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit '{limit}', expected '<requests>/<second|minute|hour>'")
+    if count < 1:
+        raise ValueError(f"Invalid rate limit '{limit}', expected at least 1 request")
+    return count, count / seconds
+
+
+class MemoryStore:
+    """ Buckets of one worker, the least recently used dropped beyond `max_keys` """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        """ Take `cost` tokens from bucket `key`: 0 when taken, else the seconds until they are available """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Atomic refill and take, with the clock of the Redis server so all workers agree
+# (replicate_commands lets Redis < 5 write after reading the clock)
+TAKE_SCRIPT = """
+redis.replicate_commands()
+local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """
+    Buckets shared by all workers, stored through a Redis client (or anything
+    with the same register_script method, such as fakeredis).
+    """
+
+    def __init__(self, client, prefix='school:ratelimit:', errors=()):
+        self.prefix = prefix
+        self.errors = errors
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, cost=1):
+        try:
+            return float(self._take(keys=[self.prefix + key], args=[capacity, rate, cost]))
+        except self.errors:
+            logger.warning('Rate limit store unavailable, letting the request through', exc_info=True)
+            metrics.increment('ratelimit_store_errors')
+            return 0
+
+
+def make_store(app_config):
+    store = app_config.get('RATELIMIT_STORE')
+    if store is not None:
+        return store
+
+    storage = app_config.get('RATELIMIT_STORAGE', 'memory')
+    if storage == 'memory':
+        return MemoryStore(app_config.get('RATELIMIT_MAX_KEYS', 100000))
+    if storage == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATELIMIT_STORAGE 'redis' requires the redis package")
+        client = redis.Redis.from_url(app_config['RATELIMIT_REDIS_URL'])
+        return RedisStore(client, errors=(redis.RedisError,))
+    raise ValueError(f"Unknown RATELIMIT_STORAGE '{storage}'")
+
+
+def client_address():
+    """ The address of the client, past the RATELIMIT_TRUSTED_PROXIES proxies in front of the app """
+    proxies = current_app.config.get('RATELIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        # Each proxy appends the address it got the request from: the last `proxies` are trusted
+        forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',')]
+        if len(forwarded) >= proxies and forwarded[-proxies]:
+            return forwarded[-proxies]
+    return request.remote_addr
+
+
+def client_key():
+    """ The JWT identity of the request, or else the client's address """
+    if 'flask-jwt-extended' in current_app.extensions:
+        from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+        from flask_jwt_extended.exceptions import JWTExtendedException
+        from jwt.exceptions import PyJWTError
+
+        try:
+            if verify_jwt_in_request(optional=True) is not None:
+                return f'user:{get_jwt_identity()}'
+        except (JWTExtendedException, PyJWTError):
+            # Rejected by the endpoint's own authentication, if it has any
+            pass
+    return f'addr:{client_address()}'
+
+
+class RateLimiter:
+    """ Per app store and limits, created from its config on first use """
+
+    def init_app(self, app):
+        app.extensions['ratelimit'] = {
+            'store': make_store(app.config),
+            'limits': {scope: parse_limit(limit) for scope, limit in app.config.get('RATELIMITS', {}).items()},
+        }
+
+    @property
+    def _state(self):
+        state = current_app.extensions.get('ratelimit')
+        if state is None:
+            self.init_app(current_app)
+            state = current_app.extensions['ratelimit']
+        return state
+
+    def hit(self, scope):
+        """ Take a token of the current client in `scope`: 0 when allowed, else the seconds to wait """
+        limit = self._state['limits'].get(scope)
+        if limit is None or not current_app.config.get('RATELIMIT_ENABLED', True):
+            return 0
+        capacity, rate = limit
+        return self._state['store'].take(f'{scope}:{client_key()}', capacity, rate)
+
+    def limit(self, scope):
+        """ Decorate a resource method to limit it with the RATELIMITS of `scope` """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                wait = self.hit(scope)
+                if wait:
+                    metrics.increment('ratelimit_rejected', scope=scope)
+                    return {'message': 'Too many requests, please retry later'}, HTTPStatus.TOO_MANY_REQUESTS, {
+                        'Retry-After': str(math.ceil(wait))
+                    }
+                return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+limiter = RateLimiter()
@@ -0,0 +1,156 @@
+import itertools
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+REPLICA_BIND_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD')
+LAST_WRITE_COOKIE = 'last_write'
+
+
+class Replica:
+    """ A read replica engine and its last known health """
+
+    def __init__(self, key, engine):
+        self.key = key
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = None
+        # A dropped connection takes the replica out of rotation until its next check
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def available(self, interval):
+        if self.checked_at is None or time.monotonic() - self.checked_at >= interval:
+            self.check()
+        return self.healthy
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(sa.text('SELECT 1'))
+        except sa.exc.DBAPIError:
+            self.healthy = False
+        else:
+            self.healthy = True
+        self.checked_at = time.monotonic()
+
+    def _handle_error(self, context):
+        if context.is_disconnect:
+            self.healthy = False
+            self.checked_at = time.monotonic()
+
+
+class ReplicaSet:
+    """ Round-robin over the healthy replicas; each is checked at most every `interval` seconds """
+
+    def __init__(self, replicas, interval):
+        self.replicas = replicas
+        self.interval = interval
+        self._counter = itertools.count()
+
+    def choose(self):
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._counter) % len(self.replicas)]
+            if replica.available(self.interval):
+                return replica
+        return None
+
+
+class Routing:
+    """
+    Sends the reads of GET and HEAD requests to the read replicas, the
+    SQLALCHEMY_BINDS whose key starts with "replica_", and everything else to
+    the primary. Reads go to the primary too:
+
+    - after the request wrote anything, or locks rows with FOR UPDATE,
+    - for REPLICA_STICKY_SECONDS after a client's last write (tracked with a
+      cookie set by init_app's hook), so clients read their own writes
+      despite replication lag,
+    - when no replica is healthy,
+    - inside `primary()`, e.g. to load what the cache then serves to every
+      client: a lagging replica would get its old rows cached.
+
+    All the other reads of one request use the same replica.
+    """
+
+    def init_app(self, app):
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def replicas():
+        replicas = current_app.extensions.get('replicas')
+        if replicas is None:
+            engines = current_app.extensions['sqlalchemy'].engines
+            replicas = current_app.extensions.setdefault('replicas', ReplicaSet(
+                [Replica(key, engine) for key, engine in sorted(engines.items(), key=lambda item: str(item[0]))
+                 if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)],
+                current_app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 30),
+            ))
+        return replicas
+
+    def replica_for_read(self):
+        """ The replica serving this request's reads, or None to read from the primary """
+        if (not has_request_context() or request.method not in READ_METHODS
+                or g.get('db_wrote') or g.get('db_force_primary')):
+            return None
+        if 'db_replica' not in g:
+            replicas = self.replicas()
+            g.db_replica = replicas.choose() if replicas.replicas and not self.wrote_recently() else None
+        return g.db_replica
+
+    @contextmanager
+    def primary(self):
+        """ Send the reads of the block to the primary """
+        if not has_request_context():
+            yield
+            return
+        forced = g.get('db_force_primary', False)
+        g.db_force_primary = True
+        try:
+            yield
+        finally:
+            g.db_force_primary = forced
+
+    @staticmethod
+    def wrote_recently():
+        try:
+            last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+        except ValueError:
+            return False
+        return time.time() - last_write < current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+    def _after_request(self, response):
+        if g.get('db_wrote') and self.replicas().replicas:
+            response.set_cookie(
+                LAST_WRITE_COOKIE, str(time.time()),
+                max_age=current_app.config.get('REPLICA_STICKY_SECONDS', 5), httponly=True
+            )
+        return response
+
+
+routing = Routing()
+
+
+class RoutingSession(Session):
+    """ db.session class that lets `routing` pick the engine of each statement """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writes = (
+                self._flushing
+                or isinstance(clause, sa.sql.expression.UpdateBase)
+                or getattr(clause, '_for_update_arg', None) is not None
+            )
+            if writes:
+                if has_request_context():
+                    g.db_wrote = True
+            else:
+                replica = routing.replica_for_read()
+                if replica is not None:
+                    return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,87 @@
+"""
+Registration of the API namespaces, at startup or on the first request.
+
+Importing the views (their resources, parsers and Swagger models, and what
+they import in turn) is a good part of the startup time, paid by every process
+that creates the app. Many never serve a request: job workers, `flask db`
+commands, tests of the models. With API_LAZY_NAMESPACES the namespaces are
+imported and registered when the app receives its first request instead,
+before it is routed. The models are always imported at startup, as the schema
+(db.create_all, migrations) needs all of them.
+
+The serving entry points (runserver.py, asgi.py) load the namespaces right
+away, so that gunicorn's preloaded master imports them once for all workers.
+The Swagger spec is built by flask-restx on the first request for
+/swagger.json, not at startup.
+"""
+import importlib
+import threading
+
+from werkzeug.utils import import_string
+
+
+PACKAGE = __name__.rsplit('.', 2)[0]
+
+# Modules defining tables, or DDL attached to them (search indexes)
+MODELS = (
+    'models.students',
+    'models.courses',
+    'models.studentcourse',
+    'models.grade',
+    'models.transcript',
+    'models.job',
+    'models.idempotency',
+    'models.search',
+)
+
+NAMESPACES = (
+    ('/courses', 'courses.views:courses_namespace'),
+    ('/students', 'students.views:students_namespace'),
+    ('/admin', 'admin.views:admin_namespace'),
+    ('/jobs', 'jobs.views:jobs_namespace'),
+)
+
+
+def load_models():
+    for module in MODELS:
+        importlib.import_module(f'{PACKAGE}.{module}')
+
+
+class LazyNamespaces:
+    """ Registers NAMESPACES on an Api, see the module docstring """
+
+    def init_app(self, app, api, namespaces=NAMESPACES):
+        load_models()
+        app.extensions['namespaces'] = {
+            'api': api,
+            'namespaces': namespaces,
+            'loaded': False,
+            'lock': threading.Lock(),
+        }
+        if not app.config.get('API_LAZY_NAMESPACES', False):
+            self.load(app)
+            return
+
+        wsgi_app = app.wsgi_app
+
+        def load_then_dispatch(environ, start_response):
+            self.load(app)
+            return wsgi_app(environ, start_response)
+
+        app.wsgi_app = load_then_dispatch
+
+    @staticmethod
+    def load(app):
+        """ Import and register the namespaces of `app`, once """
+        state = app.extensions['namespaces']
+        if state['loaded']:
+            return
+        with state['lock']:
+            if state['loaded']:
+                return
+            for path, name in state['namespaces']:
+                state['api'].add_namespace(import_string(f'{PACKAGE}.{name}'), path=path)
+            state['loaded'] = True
+
+
+namespaces = LazyNamespaces()